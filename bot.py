@@ -2,27 +2,98 @@ import discord
 from discord.ext import commands, tasks
 from discord.ui import Button, View
 import asyncio
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date as date_cls
 import io
 import asyncpg
-from PIL import Image
+from PIL import Image, ImageDraw, ImageFont, features
+import aiohttp
 from aiohttp import web
+from yarl import URL
 import random
 import json
 import base64
 import hashlib
+import re
 import sys
-from collections import deque
+import time
+import functools
+import contextvars
+import heapq
+import itertools
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import deque, Counter, OrderedDict
+from urllib.parse import urlsplit
 import pytz
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Конфігурація
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 CHANNEL_ID = int(os.getenv('DISCORD_CHANNEL_ID'))
 DATABASE_URL = os.getenv('DATABASE_URL')
 PORT = int(os.getenv('PORT', 10000))
 
+# Номер будинку, графік якого відстежуємо
+DTEK_HOUSE = os.getenv('DTEK_HOUSE', '168')
+
+# Адреса для HTTP запитів до сайту (повні назви як в автокомпліті)
+DTEK_CITY = os.getenv('DTEK_CITY', 'с. Книжичі')
+DTEK_STREET = os.getenv('DTEK_STREET', 'вул. Київська')
+
+# Сторінка графіків і AJAX endpoint сайту
+DTEK_SHUTDOWNS_URL = 'https://www.dtek-krem.com.ua/ua/shutdowns'
+DTEK_AJAX_URL = 'https://www.dtek-krem.com.ua/ua/ajax'
+
+# Серіалізатор JSONB для asyncpg: 'auto' (orjson якщо встановлений), 'orjson' або 'json'
+JSON_CODEC = os.getenv('JSON_CODEC', 'auto')
+
+# Заповнювати компактні колонки для старих записів при старті (JSONB колонки лишаються як є)
+COMPACT_LEGACY_CHECKS = os.getenv('COMPACT_LEGACY_CHECKS', '0') == '1'
+
+# Перевіряти оновлення через HTTP без браузера (браузер - тільки як fallback)
+HTTP_POLLING = os.getenv('HTTP_POLLING', '0') == '1'
+
+# Блокування зайвих запитів браузера (відео/аудіо, аналітика). Картинки і шрифти
+# за замовчуванням не блокуються - від них залежить вигляд скріншотів і трансляції;
+# їх можна додати явно: BLOCK_RESOURCE_TYPES=image,media,font
+REQUEST_BLOCKING = os.getenv('REQUEST_BLOCKING', '1') == '1'
+BLOCK_RESOURCE_TYPES = os.getenv('BLOCK_RESOURCE_TYPES', 'media')
+BLOCK_HOSTS = os.getenv(
+    'BLOCK_HOSTS',
+    'google-analytics.com,googletagmanager.com,doubleclick.net,facebook.net,'
+    'facebook.com,hotjar.com,clarity.ms,mc.yandex.ru,tiktok.com'
+)
+# Хости, які ніколи не блокуються (капча)
+ALLOW_HOSTS = os.getenv('ALLOW_HOSTS', 'google.com,gstatic.com,recaptcha.net')
+
+# Режим скріншотів графіка: 'element' - тільки область таблиці,
+# 'full' - повна сторінка з обрізкою за фіксованими координатами
+SCREENSHOT_MODE = os.getenv('SCREENSHOT_MODE', 'element')
+SCREENSHOT_PADDING = int(os.getenv('SCREENSHOT_PADDING', 10))
+
+# Зображення графіка для Discord: 'screenshot' - скріншот сайту (з локальним
+# малюванням якщо скріншот не вдався), 'render' - завжди малювати локально
+IMAGE_SOURCE = os.getenv('IMAGE_SOURCE', 'screenshot')
+# Шрифт з кирилицею для локального малювання графіка
+RENDER_FONT = os.getenv('RENDER_FONT', 'DejaVuSans.ttf')
+
+# Пул для обробки зображень поза event loop: 'thread' або 'process'
+IMAGE_POOL = os.getenv('IMAGE_POOL', 'thread')
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Пресет кодування зображень для Discord: 'fast', 'balanced' або 'small'
+IMAGE_PRESET = os.getenv('IMAGE_PRESET', 'balanced')
+
+# Джерело графіка: 'dom' - парсинг відрендереної таблиці,
+# 'network' - JSON, який сайт отримує через AJAX (з fallback на DOM)
+SCHEDULE_SOURCE = os.getenv('SCHEDULE_SOURCE', 'dom')
+
 # Часовий пояс України (UTC+2/+3)
 UKRAINE_TZ = pytz.timezone('Europe/Kiev')
 
@@ -30,20 +101,481 @@ UKRAINE_TZ = pytz.timezone('Europe/Kiev')
 db_pool = None
 
 # Логування в пам'яті для веб-інтерфейсу
-log_buffer = deque(maxlen=500)
+LOG_BUFFER_SIZE = int(os.getenv('LOG_BUFFER_SIZE', 500))
+
+# Скільки останніх циклів перевірки зберігати для /api/trace
+TRACE_CYCLES = int(os.getenv('TRACE_CYCLES', 50))
+
+# Скільки веб-інтерфейс чекає на сторінку браузера, поки йде перевірка (секунди)
+UI_PAGE_TIMEOUT = float(os.getenv('UI_PAGE_TIMEOUT', 5))
+
+# Трансляція браузера у веб-інтерфейс через CDP screencast (WebSocket /ws/screencast)
+SCREENCAST_FPS = float(os.getenv('SCREENCAST_FPS', 5))
+SCREENCAST_QUALITY = int(os.getenv('SCREENCAST_QUALITY', 60))
+SCREENCAST_MAX_WIDTH = int(os.getenv('SCREENCAST_MAX_WIDTH', 1280))
+SCREENCAST_MAX_HEIGHT = int(os.getenv('SCREENCAST_MAX_HEIGHT', 720))
+SCREENCAST_MAX_VIEWERS = int(os.getenv('SCREENCAST_MAX_VIEWERS', 3))
+
+# Скріншоти для веб-інтерфейсу: скільки секунд кадр спільний для всіх глядачів
+# і чи знімати всю сторінку замість видимої області (можна ?full=1 в запиті)
+SCREENSHOT_CACHE_TTL = float(os.getenv('SCREENSHOT_CACHE_TTL', 2.5))
+SCREENSHOT_FULL_PAGE = os.getenv('SCREENSHOT_FULL_PAGE', '0') == '1'
+
+# Розмір LRU кешу результатів порівняння графіків
+DIFF_CACHE_SIZE = int(os.getenv('DIFF_CACHE_SIZE', 64))
+
+# Скільки секунд результат перевірки вважається свіжим для !check і /api/check
+CHECK_RESULT_TTL = int(os.getenv('CHECK_RESULT_TTL', 60))
+
+# Фонова задача виміру затримки event loop
+loop_lag_task = None
+
+# AppRunner веб-сервера (для коректної зупинки)
+web_runner = None
+
+# Подія зупинки веб-сервера в app (типізований ключ - рядкові ключі aiohttp вважає застарілими)
+SHUTDOWN_KEY = web.AppKey('shutdown', asyncio.Event)
 
 # Глобальна змінна для зберігання поточної капчі
 current_captcha = None
 
-def log(message):
+LOG_LEVELS = ('debug', 'info', 'warning', 'error')
+
+# Рівень запису за емодзі на початку повідомлення
+LOG_LEVEL_MARKS = (
+    ('error', ('❌', '✖️', 'Stack trace')),
+    ('warning', ('⚠', '⏱️')),
+    ('debug', ('🔍',)),
+)
+
+def log_level(message):
+    for level, marks in LOG_LEVEL_MARKS:
+        if message.startswith(marks):
+            return level
+    return 'info'
+
+class LogBuffer:
+    """Останні записи логу з наскрізними номерами: веб-інтерфейс читає тільки нові (after=seq)"""
+    def __init__(self, maxlen):
+        self.entries = deque(maxlen=maxlen)
+        self.sequence = itertools.count(1)
+        self.last_seq = 0
+        self.watchers = set()
+    
+    def append(self, text, level):
+        entry = {'seq': next(self.sequence), 'level': level, 'text': text}
+        self.entries.append(entry)
+        self.last_seq = entry['seq']
+        # log() може викликатись не з event loop (пули зображень), тому будимо через call_soon_threadsafe
+        self.wake()
+        return entry
+    
+    def since(self, after=0, level=None, query=None):
+        """Записи з seq > after; level - мінімальний рівень, query - підрядок без урахування регістру"""
+        min_level = LOG_LEVELS.index(level) if level in LOG_LEVELS else 0
+        query = query.lower() if query else None
+        return [
+            entry for entry in list(self.entries)
+            if entry['seq'] > after
+            and LOG_LEVELS.index(entry['level']) >= min_level
+            and (query is None or query in entry['text'].lower())
+        ]
+    
+    def wake(self):
+        """Будить усіх, хто чекає на нові записи (напр. при зупинці веб-сервера)"""
+        for loop, event in list(self.watchers):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                self.watchers.discard((loop, event))
+    
+    def first_seq(self):
+        entries = self.entries
+        return entries[0]['seq'] if entries else self.last_seq + 1
+    
+    @contextmanager
+    def watch(self):
+        """asyncio.Event, що встановлюється на кожен новий запис"""
+        watcher = (asyncio.get_running_loop(), asyncio.Event())
+        self.watchers.add(watcher)
+        try:
+            yield watcher[1]
+        finally:
+            self.watchers.discard(watcher)
+
+log_buffer = LogBuffer(LOG_BUFFER_SIZE)
+
+def log(message, level=None):
     """Логування з виводом в консоль і збереженням для веб-інтерфейсу"""
     now = datetime.now(UKRAINE_TZ)
     timestamp = now.strftime('%H:%M:%S')
     log_entry = f"[{timestamp}] {message}"
     print(log_entry)
-    log_buffer.append(log_entry)
+    log_buffer.append(log_entry, level or log_level(message))
     sys.stdout.flush()
 
+class Metrics:
+    """Мінімальний реєстр метрик (counter/gauge/histogram) у текстовому форматі Prometheus"""
+    DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 240)
+
+    def __init__(self):
+        self.meta = {}
+        self.values = {}
+
+    def _declare(self, name, kind, help_text, buckets=None):
+        self.meta[name] = (kind, help_text, buckets)
+        self.values.setdefault(name, {})
+
+    def counter(self, name, help_text):
+        self._declare(name, 'counter', help_text)
+
+    def gauge(self, name, help_text):
+        self._declare(name, 'gauge', help_text)
+
+    def histogram(self, name, help_text, buckets=None):
+        self._declare(name, 'histogram', help_text, tuple(buckets or self.DEFAULT_BUCKETS))
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        series = self.values[name]
+        key = self._key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.values[name][self._key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        buckets = self.meta[name][2]
+        series = self.values[name]
+        key = self._key(labels)
+        state = series.get(key)
+        if state is None:
+            state = series[key] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                state['buckets'][i] += 1
+        state['sum'] += value
+        state['count'] += 1
+
+    @staticmethod
+    def _labels(key, extra=None):
+        items = list(key) + (extra or [])
+        if not items:
+            return ''
+        pairs = []
+        for k, v in items:
+            v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(f'{k}="{v}"')
+        return '{' + ','.join(pairs) + '}'
+
+    def render(self):
+        """Текст для /metrics"""
+        lines = []
+        for name, (kind, help_text, buckets) in self.meta.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in self.values[name].items():
+                if kind != 'histogram':
+                    lines.append(f"{name}{self._labels(key)} {value}")
+                    continue
+                for bound, count in zip(buckets, value['buckets']):
+                    lines.append(f"{name}_bucket{self._labels(key, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{self._labels(key, [('le', '+Inf')])} {value['count']}")
+                lines.append(f"{name}_sum{self._labels(key)} {value['sum']}")
+                lines.append(f"{name}_count{self._labels(key)} {value['count']}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+metrics.histogram('dtek_check_duration_seconds', 'Тривалість циклу перевірки')
+metrics.histogram('dtek_screenshot_duration_seconds', 'Тривалість однієї спроби скріншота')
+metrics.histogram('dtek_db_latency_seconds', 'Тривалість операцій з БД', buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+metrics.counter('dtek_captchas_seen_total', 'Скільки разів з\'являлась капча')
+metrics.counter('dtek_captchas_solved_total', 'Скільки капч пройдено')
+metrics.counter('dtek_updates_detected_total', 'Виявлені оновлення графіка на сайті')
+metrics.counter('dtek_discord_sends_total', 'Відправлені в Discord повідомлення з графіком')
+metrics.counter('dtek_failures_total', 'Помилки по етапах')
+metrics.gauge('dtek_chromium_rss_bytes', 'Сумарний RSS процесів Chromium')
+metrics.gauge('dtek_event_loop_lag_seconds', 'Затримка event loop (останній замір)')
+metrics.gauge('dtek_page_queue_depth', 'Скільки операцій чекає на сторінку браузера')
+metrics.histogram('dtek_page_wait_seconds', 'Очікування доступу до сторінки браузера')
+metrics.counter('dtek_page_timeouts_total', 'Операції, що не дочекались сторінки до дедлайну')
+metrics.counter('dtek_ui_screenshots_total', 'Запити скріншотів веб-інтерфейсу за результатом кешу')
+metrics.gauge('dtek_screencast_viewers', 'Підключені глядачі трансляції браузера')
+metrics.counter('dtek_screencast_frames_total', 'Кадри трансляції, отримані від Chromium')
+metrics.counter('dtek_screencast_dropped_total', 'Кадри, пропущені для повільних глядачів')
+
+# Спани трейсера, які також йдуть в гістограми/лічильники метрик
+SPAN_METRICS = {
+    'screenshot': ('dtek_screenshot_duration_seconds', {}),
+    'db_read': ('dtek_db_latency_seconds', {'op': 'read'}),
+    'db_write': ('dtek_db_latency_seconds', {'op': 'write'}),
+}
+
+class Tracer:
+    """Таймінги етапів перевірки (спани), згруповані по циклах, з обмеженою історією"""
+    def __init__(self, max_cycles):
+        self.cycles = deque(maxlen=max_cycles)
+        # Спани поза циклом (ініціалізація з веб-інтерфейсу тощо)
+        self.adhoc = deque(maxlen=max_cycles * 20)
+        self._current = contextvars.ContextVar('trace_cycle', default=None)
+
+    def record(self, stage, started, status='ok'):
+        """Записує спан, що почався в started (time.perf_counter())"""
+        now = time.perf_counter()
+        if stage in SPAN_METRICS:
+            metric, labels = SPAN_METRICS[stage]
+            metrics.observe(metric, now - started, **labels)
+        if stage == 'discord_send' and status == 'ok':
+            metrics.inc('dtek_discord_sends_total')
+        if status == 'error':
+            metrics.inc('dtek_failures_total', stage=stage)
+        cycle = self._current.get()
+        span = {
+            'stage': stage,
+            'duration_ms': round((now - started) * 1000, 1),
+            'status': status
+        }
+        if cycle is not None:
+            span['offset_ms'] = round((started - cycle['_started']) * 1000, 1)
+            cycle['spans'].append(span)
+        else:
+            span['at'] = datetime.now(UKRAINE_TZ).isoformat()
+            self.adhoc.append(span)
+
+    @contextmanager
+    def span(self, stage):
+        """Вимірює блок коду як етап поточного циклу"""
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            self.record(stage, started, status)
+
+    @contextmanager
+    def cycle(self, name):
+        """Цикл перевірки: всі спани всередині потрапляють в один запис"""
+        cycle = {
+            'name': name,
+            'started_at': datetime.now(UKRAINE_TZ).isoformat(),
+            'status': 'ok',
+            'spans': [],
+            '_started': time.perf_counter()
+        }
+        token = self._current.set(cycle)
+        try:
+            yield cycle
+        except BaseException:
+            cycle['status'] = 'error'
+            raise
+        finally:
+            self._current.reset(token)
+            duration = time.perf_counter() - cycle.pop('_started')
+            cycle['duration_ms'] = round(duration * 1000, 1)
+            self.cycles.append(cycle)
+            metrics.observe('dtek_check_duration_seconds', duration, trigger=name)
+
+    def traced(self, stage):
+        """Декоратор: async функція як етап"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def traced_cycle(self, name):
+        """Декоратор: async функція як окремий цикл"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.cycle(name):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _percentile(values, percent):
+        ordered = sorted(values)
+        index = max(0, -(-len(ordered) * percent // 100) - 1)
+        return ordered[int(index)]
+
+    def summary(self):
+        """p50/p95 по етапах за збережені цикли"""
+        durations = {}
+        for cycle in self.cycles:
+            durations.setdefault(f"cycle:{cycle['name']}", []).append(cycle['duration_ms'])
+            for span in cycle['spans']:
+                durations.setdefault(span['stage'], []).append(span['duration_ms'])
+        for span in self.adhoc:
+            durations.setdefault(span['stage'], []).append(span['duration_ms'])
+
+        return {
+            stage: {
+                'count': len(values),
+                'p50_ms': self._percentile(values, 50),
+                'p95_ms': self._percentile(values, 95),
+                'max_ms': max(values)
+            }
+            for stage, values in sorted(durations.items())
+        }
+
+tracer = Tracer(TRACE_CYCLES)
+
+# Пріоритети доступу до checker.page (менше - важливіше)
+PRIORITY_CAPTCHA = 0
+PRIORITY_AUTO = 1
+PRIORITY_MANUAL = 2
+PRIORITY_UI = 3
+PRIORITY_NAMES = {
+    PRIORITY_CAPTCHA: 'captcha',
+    PRIORITY_AUTO: 'auto',
+    PRIORITY_MANUAL: 'manual',
+    PRIORITY_UI: 'ui',
+}
+
+class PageWaiter:
+    """Заявка на сторінку в черзі PageScheduler"""
+    __slots__ = ('priority', 'name', 'future', 'enqueued_at')
+
+    def __init__(self, priority, name):
+        self.priority = priority
+        self.name = name
+        self.future = None
+        self.enqueued_at = None
+
+class PageScheduler:
+    """Серіалізує роботу з checker.page: одна операція за раз, черга за пріоритетом.
+    
+    Повторний acquire з тієї ж задачі (і її дочірніх задач) проходить одразу.
+    """
+    def __init__(self):
+        self.owner = None
+        self.queue = []
+        self.sequence = itertools.count()
+        self.holder = contextvars.ContextVar('page_holder', default=None)
+        self.granted = Counter()
+        self.timeouts = Counter()
+        self.cancelled = Counter()
+
+    def _update_depth(self):
+        metrics.set('dtek_page_queue_depth', self.depth())
+
+    def depth(self):
+        return sum(1 for *_, waiter in self.queue if not waiter.future.done())
+
+    def busy(self):
+        """Сторінку хтось тримає або на неї вже є черга"""
+        return self.owner is not None or self.depth() > 0
+
+    def _grant_next(self):
+        """Передає сторінку першій живій заявці з черги"""
+        self.owner = None
+        while self.queue:
+            *_, waiter = heapq.heappop(self.queue)
+            if waiter.future.done():
+                # Заявку скасували або вона вийшла по дедлайну
+                continue
+            self.owner = waiter
+            waiter.future.set_result(True)
+            break
+        self._update_depth()
+
+    async def _wait_turn(self, waiter, timeout):
+        """Ставить заявку в чергу і чекає, поки сторінку передадуть їй"""
+        loop = asyncio.get_running_loop()
+        waiter.future = loop.create_future()
+        waiter.enqueued_at = time.perf_counter()
+        
+        if self.owner is None and not self.depth():
+            self.owner = waiter
+            waiter.future.set_result(True)
+        else:
+            heapq.heappush(self.queue, (waiter.priority, next(self.sequence), waiter))
+            self._update_depth()
+        
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts[waiter.name] += 1
+            metrics.inc('dtek_page_timeouts_total', priority=PRIORITY_NAMES[waiter.priority])
+            self._abandon(waiter)
+            raise
+        except asyncio.CancelledError:
+            self.cancelled[waiter.name] += 1
+            self._abandon(waiter)
+            raise
+        finally:
+            metrics.observe(
+                'dtek_page_wait_seconds',
+                time.perf_counter() - waiter.enqueued_at,
+                priority=PRIORITY_NAMES[waiter.priority]
+            )
+        
+        self.granted[waiter.name] += 1
+
+    def _abandon(self, waiter):
+        """Знімає заявку; якщо сторінку вже встигли видати - передає далі"""
+        if self.owner is waiter:
+            self._grant_next()
+        elif not waiter.future.done():
+            waiter.future.cancel()
+            self._update_depth()
+
+    @asynccontextmanager
+    async def acquire(self, priority, name, timeout=None):
+        """Ексклюзивний доступ до сторінки; timeout - дедлайн очікування в черзі (asyncio.TimeoutError)"""
+        current = self.holder.get()
+        if current is not None and current is self.owner:
+            yield
+            return
+        
+        waiter = PageWaiter(priority, name)
+        await self._wait_turn(waiter, timeout)
+        token = self.holder.set(waiter)
+        try:
+            yield
+        finally:
+            self.holder.reset(token)
+            if self.owner is waiter:
+                self._grant_next()
+
+    @asynccontextmanager
+    async def released(self, priority=PRIORITY_CAPTCHA):
+        """Тимчасово віддає сторінку (напр. поки користувач розв'язує капчу), потім забирає з priority"""
+        waiter = self.holder.get()
+        if waiter is None or waiter is not self.owner:
+            yield
+            return
+        
+        self._grant_next()
+        try:
+            yield
+        finally:
+            waiter.priority = priority
+            await self._wait_turn(waiter, None)
+
+    def stats(self):
+        return {
+            'owner': self.owner.name if self.owner else None,
+            'queue': [
+                {'name': waiter.name, 'priority': PRIORITY_NAMES[waiter.priority]}
+                for *_, waiter in sorted(self.queue) if not waiter.future.done()
+            ],
+            'granted': dict(self.granted),
+            'timeouts': dict(self.timeouts),
+            'cancelled': dict(self.cancelled)
+        }
+
+page_scheduler = PageScheduler()
+
 # Створення бота
 intents = discord.Intents.default()
 intents.message_content = True
@@ -134,6 +666,1002 @@ class CaptchaView(View):
             view=self
         )
 
+# Витягує все потрібне для парсингу графіка за один виклик page.evaluate:
+# дати вкладок (div.date), дату активної вкладки і для кожної таблиці
+# вкладок (сусіди .active > table) заголовки годин та класи клітинок
+SCHEDULE_EXTRACT_JS = """
+() => {
+    const text = (el) => el && el.textContent !== null ? el.textContent.trim() : null;
+    const readTable = (table) => {
+        const hours = [];
+        const classes = [];
+        for (let i = 2; i <= 25; i++) {
+            hours.push(text(table.querySelector(`th:nth-child(${i})`)));
+            const cell = table.querySelector(`td:nth-child(${i})`);
+            classes.push(cell ? (cell.getAttribute('class') || '').trim() : null);
+        }
+        return { hours, classes };
+    };
+
+    const dates = Array.from(document.querySelectorAll('div.date')).map((el) => ({
+        text: text(el),
+        active: el.classList.contains('active'),
+    }));
+
+    const activeTable = document.querySelector('.active > table');
+    let tables = [];
+    if (activeTable) {
+        const container = activeTable.parentElement.parentElement;
+        const candidates = container
+            ? Array.from(container.querySelectorAll(':scope > * > table'))
+            : [activeTable];
+        tables = candidates.map((table) => ({
+            active: table === activeTable,
+            ...readTable(table),
+        }));
+    }
+
+    return {
+        date: text(document.querySelector('.date.active')),
+        dates,
+        tables,
+    };
+}
+"""
+
+# Область графіка для скріншота: об'єднання прямокутників вкладок дат і
+# активної таблиці у координатах документа (для clip з full_page=True)
+SCHEDULE_REGION_JS = """
+(padding) => {
+    const table = document.querySelector('.active > table');
+    if (!table) return null;
+
+    const boxes = [table, ...document.querySelectorAll('div.date')]
+        .map((el) => el.getBoundingClientRect())
+        .filter((rect) => rect.width > 0 && rect.height > 0);
+    if (!boxes.length) return null;
+
+    const left = Math.max(0, Math.min(...boxes.map((r) => r.left)) + window.scrollX - padding);
+    const top = Math.max(0, Math.min(...boxes.map((r) => r.top)) + window.scrollY - padding);
+    const right = Math.max(...boxes.map((r) => r.right)) + window.scrollX + padding;
+    const bottom = Math.max(...boxes.map((r) => r.bottom)) + window.scrollY + padding;
+
+    return { x: left, y: top, width: right - left, height: bottom - top };
+}
+"""
+
+# Умови для очікування подій на сторінці замість фіксованих пауз
+# Сторінка готова: форма пошуку або капча вже в DOM
+PAGE_READY_JS = """
+() => document.readyState !== 'loading' && !!(
+    document.querySelector('.discon-input-wrapper #city') ||
+    document.querySelector('iframe[src*="captcha"], iframe[title*="reCAPTCHA"], iframe[src*="checkbox"]')
+)
+"""
+
+# Поле вводу доступне (попередній вибір автокомпліту застосовано)
+INPUT_ENABLED_JS = """
+(selector) => {
+    const el = document.querySelector(selector);
+    return !!el && !el.disabled;
+}
+"""
+
+# Список автокомпліту заповнено щонайменше count варіантами
+AUTOCOMPLETE_READY_JS = """
+([selector, count]) => document.querySelectorAll(`${selector} > div`).length >= count
+"""
+
+# Таблиця графіка відрендерена разом з датою оновлення
+TABLE_READY_JS = """
+() => !!(document.querySelector('.active > table td') && document.querySelector('span.update'))
+"""
+
+# Запам'ятовує таблицю, показану до кліку по вкладці (див. TAB_ACTIVE_JS)
+TAB_MARK_JS = """
+() => {
+    const table = document.querySelector('.active > table');
+    window.__dtekTabBefore = table ? { table, html: table.innerHTML } : null;
+}
+"""
+
+# Вкладка з потрібною датою активна і показана таблиця - вже не та, що була до кліку
+# (інший елемент або перемальований вміст): "є td" виконується і для старої вкладки
+TAB_ACTIVE_JS = """
+(text) => {
+    const active = document.querySelector('.date.active');
+    const table = document.querySelector('.active > table');
+    if (!active || active.textContent.trim() !== text || !table || !table.querySelector('td')) {
+        return false;
+    }
+    const before = window.__dtekTabBefore;
+    return !before || table !== before.table || table.innerHTML !== before.html;
+}
+"""
+
+# Підписи вкладок дат у порядку на сторінці
+TAB_DATES_JS = """
+() => Array.from(document.querySelectorAll('div.date')).map((el) => el.textContent.trim())
+"""
+
+# Спливаюче вікно "Шановні клієнти!" закрито
+POPUP_CLOSED_JS = """
+() => {
+    const btn = document.querySelector('button.m-attention__close');
+    return !btn || btn.offsetParent === null;
+}
+"""
+
+def classify_cell(cell_class):
+    """Визначає статус години за CSS класом клітинки"""
+    if 'cell-scheduled' in cell_class:
+        return 'scheduled'
+    elif 'cell-non-scheduled' in cell_class:
+        return 'powered'
+    elif 'cell-first-half' in cell_class:
+        return 'first-half'
+    elif 'cell-second-half' in cell_class:
+        return 'second-half'
+    return 'powered'
+
+class ScheduleExtract:
+    """Результат пакетного витягування графіка зі сторінки"""
+    def __init__(self, raw):
+        raw = raw or {}
+        self.date = raw.get('date')
+        self.dates = [item.get('text') for item in raw.get('dates') or []]
+        self.tables = raw.get('tables') or []
+        self.active_index = next(
+            (i for i, table in enumerate(self.tables) if table.get('active')),
+            None
+        )
+
+    def has_table(self, index=None):
+        """Чи є таблиця для вкладки (за замовчуванням - активної)"""
+        if index is None:
+            index = self.active_index
+        return index is not None and 0 <= index < len(self.tables)
+
+    def to_schedule(self, index=None):
+        """Перетворює таблицю вкладки у Schedule"""
+        if index is None:
+            index = self.active_index
+        table = self.tables[index]
+
+        if index == self.active_index:
+            schedule_date = self.date
+        elif len(self.dates) == len(self.tables):
+            schedule_date = self.dates[index]
+        else:
+            schedule_date = None
+
+        hours = []
+        codes = []
+        for hour_text, cell_class in zip(table.get('hours') or [], table.get('classes') or []):
+            hours.append(hour_text if hour_text is not None else "??:??")
+            status = classify_cell(cell_class) if cell_class is not None else 'error'
+            codes.append(STATUS_CODES[status])
+
+        return Schedule(schedule_date, codes, hours)
+
+# Коди статусів години. Коди 0-3 - це одразу два біти півгодин без світла
+# (біт 0 - перша половина, біт 1 - друга), тому маска графіка - 48 біт
+# (біт 2*h - перша половина години h, біт 2*h+1 - друга)
+STATUSES = ('powered', 'first-half', 'second-half', 'scheduled', 'error')
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+ERROR_CODE = STATUS_CODES['error']
+OUTAGE_CODES = (STATUS_CODES['first-half'], STATUS_CODES['second-half'], STATUS_CODES['scheduled'])
+STATUS_CLASSES = {
+    'powered': 'cell-non-scheduled',
+    'first-half': 'cell-first-half',
+    'second-half': 'cell-second-half',
+    'scheduled': 'cell-scheduled',
+    'error': '',
+}
+
+def hour_label(hour):
+    """Підпис години у форматі таблиці сайту: 3 -> '03-04'"""
+    return f"{hour:02d}-{hour + 1:02d}"
+
+CANONICAL_HOURS = tuple(hour_label(hour) for hour in range(24))
+
+HALF_HOURS = 48
+FULL_DAY = (1 << HALF_HOURS) - 1
+
+class HalfHourSet:
+    """Множина півгодин доби (48 слотів) як бітова маска: слот s - це s*30 хвилин від 00:00"""
+    __slots__ = ('mask',)
+
+    def __init__(self, mask=0):
+        self.mask = mask & FULL_DAY
+
+    @classmethod
+    def from_range(cls, start, end):
+        """Слоти [start, end)"""
+        return cls(((1 << (end - start)) - 1) << start if end > start else 0)
+
+    def __or__(self, other):
+        return HalfHourSet(self.mask | other.mask)
+
+    def __and__(self, other):
+        return HalfHourSet(self.mask & other.mask)
+
+    def __sub__(self, other):
+        return HalfHourSet(self.mask & ~other.mask)
+
+    def __eq__(self, other):
+        return isinstance(other, HalfHourSet) and self.mask == other.mask
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __len__(self):
+        return self.mask.bit_count()
+
+    @property
+    def hours(self):
+        """Тривалість у годинах"""
+        return len(self) / 2
+
+    def ranges(self):
+        """Суміжні слоти, об'єднані в діапазони: [(start, end), ...]"""
+        result = []
+        mask = self.mask
+        offset = 0
+        while mask:
+            # Пропускаємо нулі, потім відрізаємо серію одиниць
+            zeros = (mask & -mask).bit_length() - 1
+            mask >>= zeros
+            offset += zeros
+            ones = (~mask & (mask + 1)).bit_length() - 1
+            result.append((offset, offset + ones))
+            mask >>= ones
+            offset += ones
+        return result
+
+    def labels(self):
+        """Діапазони текстом: ['03:30–07:00', '22:00–24:00']"""
+        return [f"{format_slot(start)}–{format_slot(end)}" for start, end in self.ranges()]
+
+    def __repr__(self):
+        return f"HalfHourSet({self.labels()})"
+
+def format_slot(slot):
+    """Номер півгодини -> 'ГГ:ХХ' (48 -> '24:00')"""
+    return f"{slot // 2:02d}:{30 if slot % 2 else 0:02d}"
+
+def format_hours(value):
+    """Тривалість у годинах без зайвого '.0': 2.0 -> '2', 1.5 -> '1,5'"""
+    return f"{value:g}".replace('.', ',')
+
+class Schedule:
+    """Графік на день: масив кодів статусів годин і похідні значення, пораховані один раз"""
+    __slots__ = ('date', 'hours', 'codes', 'mask', 'unknown', 'hash', 'outage_count', 'intervals')
+
+    def __init__(self, date, codes, hours=None):
+        self.date = date or "Невідомо"
+        self.codes = bytes(codes)
+        self.hours = tuple(hours) if hours else CANONICAL_HOURS[:len(self.codes)]
+
+        # Години понад 24 в маску не влазять, відсутні - невідомі
+        mask = 0
+        unknown = 0
+        for index in range(24):
+            code = self.codes[index] if index < len(self.codes) else ERROR_CODE
+            if code == ERROR_CODE:
+                unknown |= 1 << index
+            else:
+                mask |= code << (index * 2)
+        self.mask = mask
+        self.unknown = unknown
+
+        self.outage_count = sum(1 for code in self.codes if code in OUTAGE_CODES)
+        self.intervals = tuple(HalfHourSet(mask).ranges())
+
+        # Той самий алгоритм, що й для словників: "година:статус;" по відсортованих годинах
+        statuses = self.statuses()
+        status_string = "".join(f"{hour}:{statuses[hour]};" for hour in sorted(statuses))
+        self.hash = hashlib.md5(status_string.encode()).hexdigest()
+
+    @property
+    def outages(self):
+        """Півгодини без світла"""
+        return HalfHourSet(self.mask)
+
+    @property
+    def known(self):
+        """Півгодини годин з відомим статусом"""
+        known = 0
+        for index in range(24):
+            if not self.unknown >> index & 1:
+                known |= 0b11 << (index * 2)
+        return HalfHourSet(known)
+
+    def interval_labels(self):
+        """Інтервали відключень з точністю до півгодини: ['03:30–07:00']"""
+        return [f"{format_slot(start)}–{format_slot(end)}" for start, end in self.intervals]
+
+    def same_as(self, other):
+        """Ті самі статуси годин (незалежно від підписів і дати)"""
+        return other is not None and self.mask == other.mask and self.unknown == other.unknown
+
+    def status(self, index):
+        return STATUSES[self.codes[index]]
+
+    def statuses(self):
+        """{година: статус} (для дублікатів підписів перемагає остання, як у словнику)"""
+        return {hour: STATUSES[code] for hour, code in zip(self.hours, self.codes)}
+
+    @property
+    def has_outages(self):
+        return self.outage_count > 0
+
+    @classmethod
+    def from_dict(cls, data):
+        """З JSON формату {'date', 'hours', 'schedule': {година: {'status', 'class'}}}"""
+        hours = data.get('hours') or list(data['schedule'].keys())
+        codes = [
+            STATUS_CODES.get(data['schedule'].get(hour, {}).get('status'), ERROR_CODE)
+            for hour in hours
+        ]
+        return cls(data.get('date'), codes, hours)
+
+    @classmethod
+    def from_mask(cls, date, mask, unknown=0):
+        """З компактних колонок БД"""
+        codes = [
+            ERROR_CODE if unknown >> index & 1 else mask >> (index * 2) & 0b11
+            for index in range(24)
+        ]
+        return cls(date, codes)
+
+    def to_dict(self):
+        """У JSON формат {'date', 'hours', 'schedule'}"""
+        return {
+            'date': self.date,
+            'hours': list(self.hours),
+            'schedule': {
+                hour: {'status': STATUSES[code], 'class': STATUS_CLASSES[STATUSES[code]]}
+                for hour, code in zip(self.hours, self.codes)
+            }
+        }
+
+    def __repr__(self):
+        return f"Schedule({self.date!r}, outages={self.outage_count}, hash={self.hash[:8]})"
+
+# Дата у підписі вкладки: "16.10.25", "16.10.2025" або "16 жовтня"
+NUMERIC_DATE_RE = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{2,4})')
+TEXT_DATE_RE = re.compile(r'(\d{1,2})\s+([а-яіїєґ\']+)', re.IGNORECASE)
+MONTHS_GENITIVE = {
+    'січня': 1, 'лютого': 2, 'березня': 3, 'квітня': 4, 'травня': 5, 'червня': 6,
+    'липня': 7, 'серпня': 8, 'вересня': 9, 'жовтня': 10, 'листопада': 11, 'грудня': 12,
+}
+
+def parse_schedule_date(text, base):
+    """Дата з підпису вкладки; для формату без року - найближча до base"""
+    text = text or ''
+    try:
+        match = NUMERIC_DATE_RE.search(text)
+        if match:
+            day, month, year = (int(part) for part in match.groups())
+            return date_cls(year + 2000 if year < 100 else year, month, day)
+        
+        match = TEXT_DATE_RE.search(text)
+        if match and match.group(2).lower() in MONTHS_GENITIVE:
+            day, month = int(match.group(1)), MONTHS_GENITIVE[match.group(2).lower()]
+            candidates = [date_cls(base.year + shift, month, day) for shift in (-1, 0, 1)]
+            return min(candidates, key=lambda candidate: abs((candidate - base).days))
+    except ValueError:
+        pass
+    return None
+
+def schedule_day(schedule, offset=0, base=None):
+    """Нормалізована дата графіка: з підпису вкладки, інакше - base (сьогодні за Києвом) + offset днів"""
+    base = base or datetime.now(UKRAINE_TZ).date()
+    return parse_schedule_date(schedule.date, base) or base + timedelta(days=offset)
+
+# Статуси годин у JSON графіка сайту (DisconSchedule.fact / відповідь /ua/ajax).
+# Можливі відключення (m*/maybe) сайт малює класами cell-*-maybe, які classify_cell
+# зараховує як відповідні відключення - тут те саме, щоб джерело не змінювало графік
+NETWORK_STATUS_MAP = {
+    'yes': 'powered',
+    'no': 'scheduled',
+    'first': 'first-half',
+    'second': 'second-half',
+    'mfirst': 'first-half',
+    'msecond': 'second-half',
+    'maybe': 'scheduled',
+}
+
+def parse_page_fact(html):
+    """Витягує DisconSchedule.fact з inline-скрипта сторінки графіків (None, якщо немає)"""
+    match = re.search(r'DisconSchedule\.fact\s*=\s*', html or '')
+    if not match:
+        return None
+    try:
+        fact, _ = json.JSONDecoder().raw_decode(html, match.end())
+    except ValueError:
+        return None
+    return fact if isinstance(fact, dict) else None
+
+def parse_network_schedules(payload, house, tab_dates=()):
+    """Парсить графіки всіх днів з JSON сайту у Schedule.
+    
+    tab_dates - підписи вкладок зі сторінки: дата графіка береться з них, як і при
+    парсингу таблиці, щоб підпис не залежав від джерела.
+    """
+    if not payload:
+        return []
+
+    fact = payload.get('fact') or {}
+    days = fact.get('data') or {}
+    house_info = (payload.get('data') or {}).get(house) or {}
+    groups = house_info.get('sub_type_reason') or []
+
+    if not days or not groups:
+        return []
+
+    group = groups[0]
+    schedules = []
+    today = datetime.now(UKRAINE_TZ).date()
+    labels = {}
+    for text in tab_dates:
+        day = parse_schedule_date(text, today)
+        if day:
+            labels.setdefault(day, text)
+
+    for day_ts in sorted(days, key=int):
+        hours_data = (days[day_ts] or {}).get(group)
+        if not hours_data:
+            continue
+
+        day = datetime.fromtimestamp(int(day_ts), UKRAINE_TZ)
+        codes = []
+        for hour_num in range(1, 25):
+            value = hours_data.get(str(hour_num))
+            status = 'error' if value is None else NETWORK_STATUS_MAP.get(value, 'powered')
+            codes.append(STATUS_CODES[status])
+
+        schedules.append(Schedule(labels.get(day.date(), day.strftime('%d.%m.%y')), codes))
+
+    return schedules
+
+# Обробка зображень у пулі потоків/процесів, щоб не блокувати event loop
+# (heartbeat discord.py і веб-сервер працюють у тому ж циклі)
+class ImagePipeline:
+    """Пул для CPU-важкої роботи з зображеннями з таймінгами по етапах"""
+    def __init__(self, kind, workers):
+        self.kind = kind
+        self.workers = workers
+        self.executor = None
+        self.timings = {}
+        self.counts = Counter()
+        self.errors = Counter()
+        self.encoded_in = 0
+        self.encoded_out = 0
+
+    def _get_executor(self):
+        if self.executor is None:
+            if self.kind == 'process':
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='image'
+                )
+        return self.executor
+
+    async def run(self, stage, func, *args, **kwargs):
+        """Виконує func(*args, **kwargs) у пулі і записує час етапу"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            return await loop.run_in_executor(
+                self._get_executor(),
+                functools.partial(func, *args, **kwargs)
+            )
+        except Exception:
+            self.errors[stage] += 1
+            status = 'error'
+            raise
+        finally:
+            tracer.record(f"image:{stage}", started, status)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.timings.setdefault(stage, deque(maxlen=100)).append(elapsed_ms)
+            self.counts[stage] += 1
+
+    async def encode(self, image_bytes, preset=None):
+        """Кодує зображення для відправки (найменший формат за пресетом)"""
+        try:
+            data, info = await self.run('encode', encode_image, image_bytes, preset or IMAGE_PRESET)
+        except Exception as e:
+            log(f"⚠️ Помилка кодування зображення: {e}")
+            return image_bytes
+
+        self.encoded_in += info['bytes_in']
+        self.encoded_out += info['bytes_out']
+        saved = info['bytes_in'] - info['bytes_out']
+        log(f"🗜️ Зображення: {info['format']} {info['bytes_out']} байт "
+            f"(зекономлено {saved} байт, {info['ms']} мс)")
+        return data
+
+    def stats(self):
+        """Таймінги етапів для веб-інтерфейсу"""
+        stages = {}
+        for stage, timings in self.timings.items():
+            stages[stage] = {
+                'count': self.counts[stage],
+                'errors': self.errors[stage],
+                'last_ms': round(timings[-1], 1),
+                'avg_ms': round(sum(timings) / len(timings), 1),
+                'max_ms': round(max(timings), 1)
+            }
+        return {
+            'pool': self.kind,
+            'workers': self.workers,
+            'stages': stages,
+            'encoder': {
+                'preset': IMAGE_PRESET,
+                'bytes_in': self.encoded_in,
+                'bytes_out': self.encoded_out,
+                'bytes_saved': self.encoded_in - self.encoded_out
+            }
+        }
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+image_pipeline = ImagePipeline(IMAGE_POOL, IMAGE_WORKERS)
+
+def crop_image(screenshot_bytes, top_crop, bottom_crop, left_crop, right_crop):
+    """Обрізає PNG: повертає (байти, розмір оригіналу, координати обрізки)"""
+    image = Image.open(io.BytesIO(screenshot_bytes))
+    width, height = image.size
+    box = (left_crop, top_crop, width - right_crop, height - bottom_crop)
+
+    cropped = image.crop(box)
+    output = io.BytesIO()
+    # Швидке збереження - фінальне стиснення робить encode_image перед відправкою
+    cropped.save(output, format='PNG', compress_level=1)
+    return output.getvalue(), (width, height), box
+
+# Кандидати кодування: (назва, формат, параметри save, кількість кольорів палітри)
+IMAGE_PRESETS = {
+    'fast': {
+        'budget_ms': 100,
+        'candidates': [
+            ('png', 'PNG', {'compress_level': 1}, None),
+        ]
+    },
+    'balanced': {
+        'budget_ms': 400,
+        'candidates': [
+            ('palette-png', 'PNG', {'compress_level': 6}, 64),
+            ('webp-lossless', 'WEBP', {'lossless': True, 'method': 2, 'quality': 50}, None),
+        ]
+    },
+    'small': {
+        'budget_ms': 2000,
+        'candidates': [
+            ('palette-png', 'PNG', {'optimize': True}, 128),
+            ('webp-lossless', 'WEBP', {'lossless': True, 'method': 6, 'quality': 100}, None),
+            ('png', 'PNG', {'optimize': True}, None),
+        ]
+    },
+}
+
+def encode_image(image_bytes, preset='balanced'):
+    """Перекодовує зображення і вибирає найменший результат в межах бюджету часу"""
+    config = IMAGE_PRESETS.get(preset, IMAGE_PRESETS['balanced'])
+    started = time.perf_counter()
+
+    image = Image.open(io.BytesIO(image_bytes))
+    image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+
+    best = image_bytes
+    best_name = 'original'
+    tried = []
+
+    for name, fmt, params, colors in config['candidates']:
+        if tried and (time.perf_counter() - started) * 1000 > config['budget_ms']:
+            break
+        if fmt == 'WEBP' and not features.check('webp'):
+            continue
+
+        candidate = image
+        if colors:
+            candidate = image.convert('RGB').quantize(colors=colors, method=Image.Quantize.FASTOCTREE)
+
+        output = io.BytesIO()
+        candidate.save(output, format=fmt, **params)
+        data = output.getvalue()
+        tried.append(name)
+
+        if len(data) < len(best):
+            best = data
+            best_name = name
+
+    return best, {
+        'format': best_name,
+        'tried': tried,
+        'bytes_in': len(image_bytes),
+        'bytes_out': len(best),
+        'ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def image_extension(image_bytes):
+    """Розширення файлу за сигнатурою (PNG або WebP)"""
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return 'webp'
+    return 'png'
+
+# Локальне малювання графіка (без скріншота браузера)
+RENDER_COLORS = {
+    'background': (255, 255, 255),
+    'text': (33, 37, 41),
+    'muted': (108, 117, 125),
+    'grid': (206, 212, 218),
+    'powered': (241, 243, 245),
+    'outage': (52, 58, 64),
+    'error': (250, 82, 82),
+    'changed': (255, 146, 43),
+}
+RENDER_CELL_WIDTH = 36
+RENDER_CELL_HEIGHT = 44
+RENDER_MARGIN = 16
+
+_render_fonts = {}
+
+def _render_font(size):
+    """Шрифт з кирилицею для графіка (кешується), або вбудований шрифт Pillow"""
+    if size not in _render_fonts:
+        font = None
+        for path in (RENDER_FONT, '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'):
+            try:
+                font = ImageFont.truetype(path, size)
+                break
+            except OSError:
+                continue
+        _render_fonts[size] = font or ImageFont.load_default()
+    return _render_fonts[size]
+
+def _half_hour_statuses(code):
+    """Стан двох половин години за кодом статусу: True - світла немає"""
+    if code == ERROR_CODE:
+        return False, False
+    return bool(code & 0b01), bool(code & 0b10)
+
+class DiffCache:
+    """LRU результатів порівняння графіків за ключем (вид, хеш старого, хеш нового)"""
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, kind, old_schedule, new_schedule, compute):
+        """(результат, чи був у кеші). Хеш графіка покриває всі години і статуси"""
+        key = (kind, old_schedule.hash, new_schedule.hash)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key], True
+
+        self.misses += 1
+        value = compute()
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return value, False
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'capacity': self.size,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+diff_cache = DiffCache(DIFF_CACHE_SIZE)
+
+def changed_hours(old_schedule, new_schedule):
+    """Години, статус яких відрізняється між двома графіками"""
+    if not old_schedule or not new_schedule:
+        return set()
+    
+    def compute():
+        old_statuses = old_schedule.statuses()
+        return frozenset(
+            hour for hour, status in new_schedule.statuses().items()
+            if old_statuses.get(hour) != status
+        )
+    
+    return diff_cache.get_or_compute('hours', old_schedule, new_schedule, compute)[0]
+
+def render_schedule_image(schedule, changed=None, title=None):
+    """Малює графік (24 години з половинками, легенда, дата, зміни) у PNG"""
+    changed = changed or set()
+    hours = schedule.hours
+
+    title_font = _render_font(18)
+    label_font = _render_font(11)
+    legend_font = _render_font(12)
+
+    grid_width = RENDER_CELL_WIDTH * len(hours)
+    width = grid_width + RENDER_MARGIN * 2
+    title_height = 30
+    labels_height = 18
+    legend_height = 28
+    height = RENDER_MARGIN * 2 + title_height + labels_height + RENDER_CELL_HEIGHT + legend_height
+
+    image = Image.new('RGB', (width, height), RENDER_COLORS['background'])
+    draw = ImageDraw.Draw(image)
+
+    draw.text(
+        (RENDER_MARGIN, RENDER_MARGIN),
+        title or f"Графік відключень {schedule.date}",
+        fill=RENDER_COLORS['text'],
+        font=title_font
+    )
+
+    labels_top = RENDER_MARGIN + title_height
+    cells_top = labels_top + labels_height
+    half_width = RENDER_CELL_WIDTH // 2
+
+    for index, hour in enumerate(hours):
+        left = RENDER_MARGIN + index * RENDER_CELL_WIDTH
+        right = left + RENDER_CELL_WIDTH
+        bottom = cells_top + RENDER_CELL_HEIGHT
+
+        draw.text(
+            (left + 3, labels_top),
+            hour.split('-')[0],
+            fill=RENDER_COLORS['muted'],
+            font=label_font
+        )
+
+        code = schedule.codes[index]
+        if code == ERROR_CODE:
+            draw.rectangle((left, cells_top, right, bottom), fill=RENDER_COLORS['error'])
+        else:
+            first_out, second_out = _half_hour_statuses(code)
+            draw.rectangle(
+                (left, cells_top, left + half_width, bottom),
+                fill=RENDER_COLORS['outage' if first_out else 'powered']
+            )
+            draw.rectangle(
+                (left + half_width, cells_top, right, bottom),
+                fill=RENDER_COLORS['outage' if second_out else 'powered']
+            )
+
+        draw.rectangle((left, cells_top, right, bottom), outline=RENDER_COLORS['grid'])
+
+    # Зміни обводимо поверх сітки, щоб рамку не перекрили сусідні клітинки
+    for index, hour in enumerate(hours):
+        if hour in changed:
+            left = RENDER_MARGIN + index * RENDER_CELL_WIDTH
+            draw.rectangle(
+                (left, cells_top, left + RENDER_CELL_WIDTH, cells_top + RENDER_CELL_HEIGHT),
+                outline=RENDER_COLORS['changed'],
+                width=3
+            )
+
+    legend_top = cells_top + RENDER_CELL_HEIGHT + 10
+    legend_left = RENDER_MARGIN
+    for color, label in (('powered', 'Світло є'), ('outage', 'Відключення'), ('changed', 'Зміна')):
+        draw.rectangle(
+            (legend_left, legend_top, legend_left + 14, legend_top + 14),
+            fill=RENDER_COLORS[color],
+            outline=RENDER_COLORS['grid']
+        )
+        draw.text((legend_left + 20, legend_top), label, fill=RENDER_COLORS['text'], font=legend_font)
+        legend_left += 20 + int(draw.textlength(label, font=legend_font)) + 24
+
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+async def schedule_image(screenshot, schedule, old_schedule=None):
+    """Зображення графіка для Discord: скріншот або локально намальоване, стиснуте encode_image"""
+    if screenshot:
+        return await image_pipeline.encode(screenshot)
+    log("🎨 Малюю графік локально...")
+    image = await image_pipeline.run(
+        'render', render_schedule_image, schedule, changed=changed_hours(old_schedule, schedule)
+    )
+    log(f"✓ Графік намальовано ({len(image)} байт)")
+    return await image_pipeline.encode(image)
+
+# Версійовані міграції схеми: (версія, опис, список SQL). Нові - тільки в кінець списку
+MIGRATIONS = [
+    (1, 'таблиця dtek_checks', [
+        '''
+        CREATE TABLE IF NOT EXISTS dtek_checks (
+            id SERIAL PRIMARY KEY,
+            update_date TEXT,
+            schedule_hash TEXT,
+            schedule_data JSONB,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+    ]),
+    (2, 'колонки графіка на завтра', [
+        'ALTER TABLE dtek_checks ADD COLUMN IF NOT EXISTS schedule_tomorrow_hash TEXT',
+        'ALTER TABLE dtek_checks ADD COLUMN IF NOT EXISTS schedule_tomorrow_data JSONB',
+    ]),
+    (3, 'індекси для історії перевірок', [
+        'CREATE INDEX IF NOT EXISTS dtek_checks_created_idx ON dtek_checks (created_at DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS dtek_checks_date_created_idx ON dtek_checks (update_date, created_at DESC, id DESC)',
+    ]),
+    (4, 'компактні колонки графіків (маски півгодин)', [
+        'ALTER TABLE dtek_checks ADD COLUMN IF NOT EXISTS schedule_date TEXT',
+        'ALTER TABLE dtek_checks ADD COLUMN IF NOT EXISTS schedule_mask BIGINT',
+        'ALTER TABLE dtek_checks ADD COLUMN IF NOT EXISTS schedule_unknown INTEGER',
+        'ALTER TABLE dtek_checks ADD COLUMN IF NOT EXISTS schedule_tomorrow_date TEXT',
+        'ALTER TABLE dtek_checks ADD COLUMN IF NOT EXISTS schedule_tomorrow_mask BIGINT',
+        'ALTER TABLE dtek_checks ADD COLUMN IF NOT EXISTS schedule_tomorrow_unknown INTEGER',
+    ]),
+    (5, 'версії графіків за датою графіка', [
+        '''
+        CREATE TABLE IF NOT EXISTS schedule_versions (
+            id SERIAL PRIMARY KEY,
+            schedule_day DATE NOT NULL,
+            version INTEGER NOT NULL,
+            schedule_hash TEXT NOT NULL,
+            date_text TEXT,
+            schedule_mask BIGINT NOT NULL,
+            schedule_unknown INTEGER NOT NULL DEFAULT 0,
+            update_date TEXT,
+            created_at TIMESTAMP DEFAULT NOW(),
+            UNIQUE (schedule_day, version)
+        )
+        ''',
+    ]),
+]
+
+# Можливості схеми БД, визначені один раз при старті (див. init_db_pool)
+db_capabilities = {
+    'schema_version': 0,
+    'tomorrow_columns': False,
+    'compact_columns': False,
+}
+
+# Колонки компактного формату (міграція 4)
+COMPACT_COLUMNS = {
+    'schedule_date', 'schedule_mask', 'schedule_unknown',
+    'schedule_tomorrow_date', 'schedule_tomorrow_mask', 'schedule_tomorrow_unknown',
+}
+
+async def run_migrations(conn):
+    """Застосовує непройдені міграції і повертає поточну версію схеми"""
+    async with conn.transaction():
+        # Захист від паралельного запуску кількох інстансів: усе, включно з
+        # таблицею версій, створюється вже під блокуванням
+        await conn.execute('SELECT pg_advisory_xact_lock(hashtext($1))', 'dtek_checks_migrations')
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT NOW()
+            )
+        ''')
+        current = await conn.fetchval('SELECT COALESCE(MAX(version), 0) FROM schema_migrations')
+        
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for sql in statements:
+                await conn.execute(sql)
+            await conn.execute(
+                'INSERT INTO schema_migrations (version, description) VALUES ($1, $2)',
+                version, description
+            )
+            log(f"✓ Міграція {version} застосована: {description}")
+            current = version
+    
+    return current
+
+async def load_db_capabilities(conn):
+    """Один раз читає структуру таблиці і кешує можливості для data-access шару"""
+    rows = await conn.fetch('''
+        SELECT column_name 
+        FROM information_schema.columns 
+        WHERE table_name = 'dtek_checks'
+    ''')
+    columns = {row['column_name'] for row in rows}
+    db_capabilities['tomorrow_columns'] = {'schedule_tomorrow_hash', 'schedule_tomorrow_data'} <= columns
+    db_capabilities['compact_columns'] = db_capabilities['tomorrow_columns'] and COMPACT_COLUMNS <= columns
+    log(f"🔍 Колонки dtek_checks: {sorted(columns)}")
+
+def json_codec():
+    """(encoder, decoder, назва) для JSON/JSONB колонок"""
+    if JSON_CODEC != 'json' and orjson is not None:
+        return (lambda value: orjson.dumps(value).decode()), orjson.loads, 'orjson'
+    if JSON_CODEC == 'orjson':
+        log("⚠️ orjson не встановлено, використовую стандартний json")
+    return (lambda value: json.dumps(value, ensure_ascii=False)), json.loads, 'json'
+
+def _compact_schedule(data):
+    """Schedule зі старого JSONB, якщо маска передає його без втрат, інакше ValueError"""
+    if not isinstance(data, dict) or not isinstance(data.get('schedule'), dict):
+        raise ValueError(f'не об\'єкт графіка: {type(data).__name__}')
+    statuses = {entry.get('status') if isinstance(entry, dict) else None for entry in data['schedule'].values()}
+    if not statuses <= STATUS_CODES.keys():
+        raise ValueError(f'невідомі статуси: {sorted(map(str, statuses - STATUS_CODES.keys()))}')
+    schedule = Schedule.from_dict(data)
+    restored = Schedule.from_mask(schedule.date, schedule.mask, schedule.unknown)
+    if len(schedule.codes) != len(restored.codes) or not restored.same_as(schedule):
+        raise ValueError(f'{len(schedule.codes)} годин замість {len(restored.codes)}')
+    return schedule
+
+async def compact_legacy_checks(conn, batch_size=500):
+    """Заповнює компактні маски для старих записів з JSONB графіками (ідемпотентно).
+    
+    JSONB колонки не змінюються; записи, які маска не передає без втрат, пропускаються.
+    """
+    total = 0
+    skipped = 0
+    last_id = 0
+    while True:
+        rows = await conn.fetch('''
+            SELECT id, schedule_data, schedule_tomorrow_data
+            FROM dtek_checks
+            WHERE schedule_mask IS NULL AND jsonb_typeof(schedule_data) = 'object' AND id > $1
+            ORDER BY id
+            LIMIT $2
+        ''', last_id, batch_size)
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        
+        updates = []
+        for row in rows:
+            try:
+                today = _compact_schedule(row['schedule_data'])
+                update = [row['id'], today.date, today.mask, today.unknown, None, None, None]
+                if row['schedule_tomorrow_data'] is not None:
+                    tomorrow = _compact_schedule(row['schedule_tomorrow_data'])
+                    update[4:] = [tomorrow.date, tomorrow.mask, tomorrow.unknown]
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                skipped += 1
+                log(f"⚠️ Запис {row['id']} лишається в JSONB: {e}")
+                continue
+            updates.append(update)
+        
+        if updates:
+            await conn.executemany('''
+                UPDATE dtek_checks
+                SET schedule_date = $2, schedule_mask = $3, schedule_unknown = $4,
+                    schedule_tomorrow_date = $5, schedule_tomorrow_mask = $6, schedule_tomorrow_unknown = $7
+                WHERE id = $1
+            ''', updates)
+        total += len(updates)
+    
+    if skipped:
+        log(f"⚠️ Пропущено записів, які не можна стиснути без втрат: {skipped}")
+    if total:
+        log(f"✓ Компактні колонки заповнено для старих записів: {total}")
+
+async def init_db_connection(conn):
+    """Реєструє кодеки JSON/JSONB, щоб графіки ходили в БД і назад як dict"""
+    encoder, decoder, _ = json_codec()
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(
+            type_name,
+            encoder=encoder,
+            decoder=decoder,
+            schema='pg_catalog',
+            format='text'
+        )
+
 async def init_db_pool():
     """Ініціалізація connection pool для PostgreSQL"""
     global db_pool
@@ -142,40 +1670,34 @@ async def init_db_pool():
             DATABASE_URL,
             min_size=1,
             max_size=10,
-            command_timeout=60
+            command_timeout=60,
+            init=init_db_connection
         )
+        log(f"✓ JSON кодек БД: {json_codec()[2]}")
         log("✓ Database pool створено")
         
         async with db_pool.acquire() as conn:
-            # Створюємо основну таблицю
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS dtek_checks (
-                    id SERIAL PRIMARY KEY,
-                    update_date TEXT,
-                    schedule_hash TEXT,
-                    schedule_data JSONB,
-                    created_at TIMESTAMP DEFAULT NOW()
-                )
-            ''')
-            
-            # Додаємо нові колонки якщо їх немає (міграція)
             try:
-                await conn.execute('''
-                    ALTER TABLE dtek_checks 
-                    ADD COLUMN IF NOT EXISTS schedule_tomorrow_hash TEXT
-                ''')
-                log("✓ Колонка schedule_tomorrow_hash додана/існує")
+                db_capabilities['schema_version'] = await run_migrations(conn)
+                log(f"✓ Версія схеми БД: {db_capabilities['schema_version']}")
             except Exception as e:
-                log(f"⚠️ Помилка додавання schedule_tomorrow_hash: {e}")
+                log(f"⚠️ Помилка міграції БД: {e}")
             
-            try:
-                await conn.execute('''
-                    ALTER TABLE dtek_checks 
-                    ADD COLUMN IF NOT EXISTS schedule_tomorrow_data JSONB
-                ''')
-                log("✓ Колонка schedule_tomorrow_data додана/існує")
-            except Exception as e:
-                log(f"⚠️ Помилка додавання schedule_tomorrow_data: {e}")
+            await load_db_capabilities(conn)
+            if not db_capabilities['tomorrow_columns']:
+                log("⚠️ Стара структура БД (без колонок для графіка завтра)")
+            
+            if db_capabilities['compact_columns'] and COMPACT_LEGACY_CHECKS:
+                try:
+                    await compact_legacy_checks(conn)
+                except Exception as e:
+                    log(f"⚠️ Помилка стиснення старих записів: {e}")
+            
+            if db_capabilities['schema_version'] >= 5:
+                try:
+                    await schedule_store.seed_from_checks(conn)
+                except Exception as e:
+                    log(f"⚠️ Помилка заповнення версій графіків: {e}")
         
         log("✓ Таблиця БД готова")
 
@@ -415,6 +1937,12 @@ async def handle_root(request):
             .log-entry:hover {
                 background: rgba(255,255,255,0.1);
             }
+            .log-entry.log-warning {
+                color: #ffd166;
+            }
+            .log-entry.log-error {
+                color: #ff6b6b;
+            }
             .logs-container::-webkit-scrollbar {
                 width: 8px;
             }
@@ -426,6 +1954,17 @@ async def handle_root(request):
                 background: #667eea;
                 border-radius: 4px;
             }
+            .logs-filters {
+                display: flex;
+                gap: 6px;
+            }
+            .logs-filters select,
+            .logs-filters input {
+                padding: 5px 8px;
+                font-size: 12px;
+                border: 1px solid #ccc;
+                border-radius: 5px;
+            }
             .clear-logs-btn {
                 padding: 6px 12px;
                 font-size: 12px;
@@ -514,7 +2053,16 @@ async def handle_root(request):
                 <div class="logs-panel">
                     <div class="logs-header">
                         <h2>📋 Логи бота</h2>
-                        <button class="clear-logs-btn" onclick="clearLogsDisplay()">🗑️ Очистити</button>
+                        <div class="logs-filters">
+                            <select id="logs-level" onchange="applyLogFilters()">
+                                <option value="">Усі рівні</option>
+                                <option value="info">info+</option>
+                                <option value="warning">warning+</option>
+                                <option value="error">error</option>
+                            </select>
+                            <input id="logs-query" type="search" placeholder="Пошук..." onchange="applyLogFilters()">
+                            <button class="clear-logs-btn" onclick="clearLogsDisplay()">🗑️ Очистити</button>
+                        </div>
                     </div>
                     <div class="logs-container" id="logs">
                         <div class="log-entry">Завантаження логів...</div>
@@ -528,6 +2076,14 @@ async def handle_root(request):
             let imageNaturalWidth = 0;
             let imageNaturalHeight = 0;
             let logsAutoScroll = true;
+            let screencast = null;
+            let screenshotEtag = null;
+            let logsSeq = 0;
+            let logsStream = null;
+            let logsSource = null;
+            const MAX_LOG_ENTRIES = 500;
+            let pageWidth = 0;
+            let pageHeight = 0;
             
             async function request(endpoint, method = 'GET', body = null) {
                 const options = { method };
@@ -541,8 +2097,13 @@ async def handle_root(request):
             
             async function refreshScreenshot() {
                 try {
-                    const data = await request('/api/screenshot');
+                    // Кадр не змінився - сервер відповідає 304 без тіла
+                    const headers = screenshotEtag ? { 'If-None-Match': screenshotEtag } : {};
+                    const response = await fetch('/api/screenshot', { headers });
+                    if (response.status === 304) return;
+                    const data = await response.json();
                     if (data.screenshot) {
+                        screenshotEtag = response.headers.get('ETag');
                         const img = document.getElementById('screenshot');
                         img.src = 'data:image/png;base64,' + data.screenshot;
                         img.style.display = 'block';
@@ -560,6 +2121,51 @@ async def handle_root(request):
                 }
             }
             
+            function connectScreencast() {
+                const proto = location.protocol === 'https:' ? 'wss:' : 'ws:';
+                const ws = new WebSocket(`${proto}//${location.host}/ws/screencast`);
+                ws.binaryType = 'blob';
+                
+                ws.onopen = () => { screencast = ws; };
+                ws.onmessage = (event) => {
+                    if (typeof event.data === 'string') {
+                        const msg = JSON.parse(event.data);
+                        // Розмір сторінки для масштабування кліків: кадр може бути зменшеним
+                        if (msg.type === 'meta') {
+                            pageWidth = msg.width;
+                            pageHeight = msg.height;
+                        }
+                        return;
+                    }
+                    
+                    const img = document.getElementById('screenshot');
+                    const url = URL.createObjectURL(event.data);
+                    img.onload = function() {
+                        URL.revokeObjectURL(url);
+                        imageNaturalWidth = img.naturalWidth;
+                        imageNaturalHeight = img.naturalHeight;
+                    };
+                    img.src = url;
+                    img.style.display = 'block';
+                    document.getElementById('loading').style.display = 'none';
+                    document.getElementById('last-refresh').textContent = new Date().toLocaleTimeString();
+                };
+                // Без трансляції (браузер не запущено, забагато глядачів) - опитуємо скріншоти
+                ws.onclose = () => {
+                    screencast = null;
+                    pageWidth = 0;
+                    pageHeight = 0;
+                    setTimeout(connectScreencast, 5000);
+                };
+            }
+            
+            function pageScale(rect) {
+                if (screencast && pageWidth && pageHeight) {
+                    return { scaleX: pageWidth / rect.width, scaleY: pageHeight / rect.height };
+                }
+                return { scaleX: imageNaturalWidth / rect.width, scaleY: imageNaturalHeight / rect.height };
+            }
+            
             async function initBrowser() {
                 document.getElementById('status').textContent = '⏳ Ініціалізація...';
                 try {
@@ -577,7 +2183,7 @@ async def handle_root(request):
                 try {
                     const data = await request('/api/check');
                     alert(data.message);
-                    await refreshScreenshot();
+                    if (!screencast) await refreshScreenshot();
                 } catch (e) {
                     alert('Помилка: ' + e.message);
                 }
@@ -597,8 +2203,7 @@ async def handle_root(request):
                 const img = event.target;
                 const rect = img.getBoundingClientRect();
                 
-                const scaleX = imageNaturalWidth / rect.width;
-                const scaleY = imageNaturalHeight / rect.height;
+                const { scaleX, scaleY } = pageScale(rect);
                 
                 const x = Math.round((event.clientX - rect.left) * scaleX);
                 const y = Math.round((event.clientY - rect.top) * scaleY);
@@ -608,7 +2213,7 @@ async def handle_root(request):
                 try {
                     const data = await request('/api/click', 'POST', { x, y });
                     console.log(data.message);
-                    setTimeout(refreshScreenshot, 1000);
+                    if (!screencast) setTimeout(refreshScreenshot, 1000);
                 } catch (e) {
                     console.error('Click error:', e);
                 }
@@ -617,8 +2222,7 @@ async def handle_root(request):
             document.getElementById('screenshot').addEventListener('mousemove', (e) => {
                 const img = e.target;
                 const rect = img.getBoundingClientRect();
-                const scaleX = imageNaturalWidth / rect.width;
-                const scaleY = imageNaturalHeight / rect.height;
+                const { scaleX, scaleY } = pageScale(rect);
                 const x = Math.round((e.clientX - rect.left) * scaleX);
                 const y = Math.round((e.clientY - rect.top) * scaleY);
                 document.getElementById('coords').textContent = `X: ${x}, Y: ${y}`;
@@ -645,31 +2249,72 @@ async def handle_root(request):
                 }
             }
             
+            // Дописуємо тільки нові записи замість перебудови всього списку
+            function appendLogs(entries) {
+                const logsContainer = document.getElementById('logs');
+                const shouldScroll = logsContainer.scrollHeight - logsContainer.scrollTop <= logsContainer.clientHeight + 50;
+                if (logsSeq === 0 && entries.length > 0) {
+                    logsContainer.innerHTML = '';
+                }
+                
+                const fragment = document.createDocumentFragment();
+                for (const entry of entries) {
+                    if (entry.seq <= logsSeq) continue;
+                    const div = document.createElement('div');
+                    div.className = `log-entry log-${entry.level}`;
+                    div.textContent = entry.text;
+                    fragment.appendChild(div);
+                    logsSeq = entry.seq;
+                }
+                logsContainer.appendChild(fragment);
+                
+                while (logsContainer.childElementCount > MAX_LOG_ENTRIES) {
+                    logsContainer.firstElementChild.remove();
+                }
+                
+                if (shouldScroll && logsAutoScroll) {
+                    logsContainer.scrollTop = logsContainer.scrollHeight;
+                }
+            }
+            
+            // Фільтри рівня і підрядка застосовує сервер
+            function logsQuery() {
+                const params = new URLSearchParams({ after: logsSeq });
+                const level = document.getElementById('logs-level').value;
+                const query = document.getElementById('logs-query').value.trim();
+                if (level) params.set('level', level);
+                if (query) params.set('q', query);
+                return params.toString();
+            }
+            
             async function updateLogs() {
                 try {
-                    const data = await request('/api/logs');
-                    const logsContainer = document.getElementById('logs');
-                    
-                    if (data.logs && data.logs.length > 0) {
-                        const shouldScroll = logsContainer.scrollHeight - logsContainer.scrollTop <= logsContainer.clientHeight + 50;
-                        
-                        logsContainer.innerHTML = data.logs.map(log => 
-                            `<div class="log-entry">${escapeHtml(log)}</div>`
-                        ).join('');
-                        
-                        if (shouldScroll && logsAutoScroll) {
-                            logsContainer.scrollTop = logsContainer.scrollHeight;
-                        }
-                    }
+                    const data = await request(`/api/logs?${logsQuery()}`);
+                    if (data.logs) appendLogs(data.logs);
                 } catch (e) {
                     console.error('Logs update error:', e);
                 }
             }
             
-            function escapeHtml(text) {
-                const div = document.createElement('div');
-                div.textContent = text;
-                return div.innerHTML;
+            // SSE: сервер сам шле нові записи; при обриві EventSource перепідключається з Last-Event-ID
+            function connectLogStream() {
+                if (!window.EventSource) return;
+                const source = new EventSource(`/api/logs/stream?${logsQuery()}`);
+                source.onopen = () => { logsStream = source; };
+                source.onmessage = (event) => appendLogs([JSON.parse(event.data)]);
+                source.onerror = () => { if (logsStream === source) logsStream = null; };
+                logsSource = source;
+            }
+            
+            // Нові фільтри - перечитуємо буфер з початку
+            function applyLogFilters() {
+                if (logsSource) logsSource.close();
+                logsSource = null;
+                logsStream = null;
+                logsSeq = 0;
+                document.getElementById('logs').innerHTML = '';
+                connectLogStream();
+                updateLogs();
             }
             
             function clearLogsDisplay() {
@@ -683,9 +2328,9 @@ async def handle_root(request):
             
             function startAutoRefresh() {
                 autoRefresh = setInterval(() => {
-                    refreshScreenshot();
+                    if (!screencast) refreshScreenshot();
                     updateStatus();
-                    updateLogs();
+                    if (!logsStream) updateLogs();
                 }, 3000);
             }
             
@@ -693,6 +2338,8 @@ async def handle_root(request):
                 await updateStatus();
                 await updateLogs();
                 await refreshScreenshot();
+                connectScreencast();
+                connectLogStream();
                 startAutoRefresh();
             };
         </script>
@@ -701,19 +2348,313 @@ async def handle_root(request):
     """
     return web.Response(text=html, content_type='text/html')
 
+def ui_priority():
+    """Дії з веб-інтерфейсу під час капчі - це розв'язування капчі"""
+    if current_captcha and current_captcha.active:
+        return PRIORITY_CAPTCHA
+    return PRIORITY_UI
+
+class ScreencastHub:
+    """Одна CDP screencast сесія на всіх глядачів веб-інтерфейсу.
+    Chromium шле JPEG кадри тільки коли сторінка змінюється; наступний кадр
+    приходить лише після ack, тому затримка ack обмежує FPS
+    """
+    def __init__(self, fps, quality, max_width, max_height, max_viewers):
+        self.interval = 1 / fps if fps > 0 else 0
+        self.quality = quality
+        self.max_width = max_width
+        self.max_height = max_height
+        self.max_viewers = max_viewers
+        self.viewers = {}
+        self.viewer_meta = {}
+        self.tasks = set()
+        self.session = None
+        self.page = None
+        self.meta = None
+        self.last_frame = None
+        self.last_frame_at = 0
+        self.lock = asyncio.Lock()
+        self.counts = Counter()
+    
+    async def join(self, ws):
+        """Додає глядача; False якщо місць немає"""
+        if len(self.viewers) >= self.max_viewers:
+            self.counts['rejected'] += 1
+            return False
+        self.viewers[ws] = None
+        metrics.set('dtek_screencast_viewers', len(self.viewers))
+        if self.last_frame:
+            await self._deliver(ws, self.last_frame)
+        await self.attach()
+        return True
+    
+    async def leave(self, ws):
+        pending = self.viewers.pop(ws, None)
+        self.viewer_meta.pop(ws, None)
+        if pending and not pending.done():
+            pending.cancel()
+        metrics.set('dtek_screencast_viewers', len(self.viewers))
+        if not self.viewers:
+            await self.detach()
+    
+    async def attach(self):
+        """Запускає трансляцію поточної сторінки, якщо є глядачі"""
+        async with self.lock:
+            page = checker.page
+            if not self.viewers or not page or (self.session and self.page is page):
+                return
+            await self._stop()
+            try:
+                # Трансляція пасивна і не змагається з перевіркою за сторінку
+                session = await page.context.new_cdp_session(page)
+                session.on('Page.screencastFrame', self._on_frame)
+                await session.send('Page.startScreencast', {
+                    'format': 'jpeg',
+                    'quality': self.quality,
+                    'maxWidth': self.max_width,
+                    'maxHeight': self.max_height
+                })
+            except Exception as e:
+                log(f"⚠️ Не вдалось запустити трансляцію браузера: {e}")
+                return
+            self.session = session
+            self.page = page
+            self.counts['started'] += 1
+            log(f"📺 Трансляція браузера запущена, глядачів: {len(self.viewers)}")
+    
+    async def detach(self):
+        async with self.lock:
+            await self._stop()
+    
+    async def _stop(self):
+        session = self.session
+        self.session = None
+        self.page = None
+        self.meta = None
+        self.last_frame = None
+        if session:
+            try:
+                await session.send('Page.stopScreencast')
+                await session.detach()
+            except Exception:
+                # Сторінка вже закрита - сесія зникла разом з нею
+                pass
+            log("📺 Трансляцію браузера зупинено")
+    
+    def _spawn(self, coro, name):
+        """Фонова задача хаба: посилання тримаємо до завершення, помилки логуємо"""
+        task = asyncio.create_task(coro, name=name)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+    
+    def _task_done(self, task):
+        self.tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is None:
+            return
+        if isinstance(error, (ConnectionResetError, RuntimeError)):
+            # Глядач відключився посеред відправки - його прибере handle_screencast
+            self.counts['send_errors'] += 1
+        else:
+            log(f"⚠️ Помилка трансляції ({task.get_name()}): {error!r}")
+    
+    def _on_frame(self, params):
+        self._spawn(self._handle_frame(self.session, params), 'screencast_frame')
+    
+    async def _handle_frame(self, session, params):
+        metrics.inc('dtek_screencast_frames_total')
+        frame = base64.b64decode(params['data'])
+        meta = params.get('metadata', {})
+        # Розмір сторінки в CSS пікселях: по ньому веб-інтерфейс масштабує кліки
+        view = {
+            'type': 'meta',
+            'width': meta.get('deviceWidth'),
+            'height': meta.get('deviceHeight')
+        }
+        self.meta = view
+        self.last_frame = frame
+        for ws in list(self.viewers):
+            self._send(ws, frame)
+        
+        # Ack з затримкою: Chromium не шле новий кадр, поки не отримає ack
+        delay = self.last_frame_at + self.interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.last_frame_at = time.monotonic()
+        if session is self.session:
+            try:
+                await session.send('Page.screencastFrameAck', {'sessionId': params['sessionId']})
+            except Exception:
+                pass
+    
+    def _send(self, ws, frame):
+        """Повільний глядач пропускає кадр замість того, щоб накопичувати чергу"""
+        pending = self.viewers.get(ws)
+        if pending and not pending.done():
+            metrics.inc('dtek_screencast_dropped_total')
+            return
+        if ws in self.viewers:
+            self.viewers[ws] = self._spawn(self._deliver(ws, frame), 'screencast_send')
+    
+    async def _deliver(self, ws, frame):
+        # Розмір сторінки шлемо перед кадром, якщо глядач його ще не знає
+        if self.meta and self.viewer_meta.get(ws) != self.meta:
+            self.viewer_meta[ws] = self.meta
+            await ws.send_json(self.meta)
+        await ws.send_bytes(frame)
+    
+    def stats(self):
+        return {
+            'active': self.session is not None,
+            'viewers': len(self.viewers),
+            'max_viewers': self.max_viewers,
+            'fps': round(1 / self.interval, 1) if self.interval else None,
+            'quality': self.quality,
+            'counts': dict(self.counts)
+        }
+
+screencast_hub = ScreencastHub(
+    SCREENCAST_FPS, SCREENCAST_QUALITY,
+    SCREENCAST_MAX_WIDTH, SCREENCAST_MAX_HEIGHT, SCREENCAST_MAX_VIEWERS
+)
+
+async def handle_screencast(request):
+    """WebSocket: трансляція браузера JPEG кадрами"""
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    
+    if not checker.page:
+        await ws.send_json({'type': 'error', 'reason': 'browser', 'message': 'Browser not initialized'})
+        await ws.close()
+        return ws
+    if not await screencast_hub.join(ws):
+        await ws.send_json({'type': 'error', 'reason': 'viewers', 'message': 'Too many viewers'})
+        await ws.close()
+        return ws
+    
+    try:
+        async for msg in ws:
+            # Клієнт нічого не шле, окрім ping; з'єднання тримаємо до закриття
+            pass
+    finally:
+        await screencast_hub.leave(ws)
+    return ws
+
+class ScreenshotService:
+    """Кеш скріншотів для веб-інтерфейсу: один знімок на TTL для всіх глядачів,
+    паралельні промахи чекають один знімок, під час перевірки віддається старий кадр
+    """
+    def __init__(self, ttl, full_page):
+        self.ttl = ttl
+        self.full_page = full_page
+        self.frames = {}
+        self.in_flight = {}
+        self.counts = Counter()
+    
+    def _count(self, result):
+        self.counts[result] += 1
+        metrics.inc('dtek_ui_screenshots_total', result=result)
+    
+    async def get(self, full_page=None):
+        """Кадр {'data', 'etag', 'timestamp', 'taken_at'}; asyncio.TimeoutError якщо сторінка зайнята і кадру немає"""
+        if full_page is None:
+            full_page = self.full_page
+        frame = self.frames.get(full_page)
+        if frame and time.monotonic() - frame['taken_at'] <= self.ttl:
+            self._count('hit')
+            return frame
+        
+        # Перевірку не перебиваємо: поки сторінка зайнята, показуємо останній кадр
+        if frame and page_scheduler.busy():
+            self._count('stale')
+            return frame
+        
+        task = self.in_flight.get(full_page)
+        if task is None:
+            self._count('miss')
+            task = asyncio.create_task(self._capture(full_page))
+            self.in_flight[full_page] = task
+            task.add_done_callback(functools.partial(self._finished, full_page))
+        else:
+            self._count('joined')
+        
+        try:
+            return await asyncio.shield(task)
+        except asyncio.TimeoutError:
+            if frame:
+                self._count('stale')
+                return frame
+            raise
+    
+    def _finished(self, full_page, task):
+        self.in_flight.pop(full_page, None)
+        if not task.cancelled():
+            # Помилку вже отримали ті, хто чекав; тут лише позначаємо її як прочитану
+            task.exception()
+    
+    async def _capture(self, full_page):
+        async with page_scheduler.acquire(ui_priority(), 'ui_screenshot', timeout=UI_PAGE_TIMEOUT):
+            data = await checker.page.screenshot(type='png', full_page=full_page)
+        
+        etag = hashlib.md5(data).hexdigest()
+        previous = self.frames.get(full_page)
+        if previous and previous['etag'] == etag:
+            # Сторінка не змінилась - лишаємо старий timestamp, оновлюємо тільки вік
+            previous['taken_at'] = time.monotonic()
+            return previous
+        
+        frame = {
+            'data': data,
+            'etag': etag,
+            'timestamp': datetime.now(UKRAINE_TZ).isoformat(),
+            'taken_at': time.monotonic()
+        }
+        self.frames[full_page] = frame
+        return frame
+    
+    def invalidate(self):
+        """Наступний запит зніме новий кадр (після кліку, перезапуску браузера)"""
+        for frame in self.frames.values():
+            frame['taken_at'] = float('-inf')
+    
+    def stats(self):
+        return {
+            'ttl': self.ttl,
+            'full_page': self.full_page,
+            'cached': sorted('full' if mode else 'viewport' for mode in self.frames),
+            'in_flight': len(self.in_flight),
+            'counts': dict(self.counts)
+        }
+
+screenshot_service = ScreenshotService(SCREENSHOT_CACHE_TTL, SCREENSHOT_FULL_PAGE)
+
 async def handle_screenshot(request):
     """API: Получити скріншот браузера"""
     try:
         if not checker.page:
             return web.json_response({'error': 'Browser not initialized'}, status=400)
         
-        screenshot = await checker.page.screenshot(type='png', full_page=True)
-        screenshot_base64 = base64.b64encode(screenshot).decode('utf-8')
+        full_page = request.query.get('full')
+        full_page = full_page == '1' if full_page is not None else None
+        try:
+            frame = await screenshot_service.get(full_page)
+        except asyncio.TimeoutError:
+            return web.json_response({'error': 'Browser busy', 'busy': page_scheduler.stats()['owner']}, status=503)
+        
+        etag = f'"{frame["etag"]}"'
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers=headers)
+        
+        screenshot_base64 = base64.b64encode(frame['data']).decode('utf-8')
         
         return web.json_response({
             'screenshot': screenshot_base64,
-            'timestamp': datetime.now(UKRAINE_TZ).isoformat()
-        })
+            'timestamp': frame['timestamp']
+        }, headers=headers)
     except Exception as e:
         return web.json_response({'error': str(e)}, status=500)
 
@@ -727,7 +2668,12 @@ async def handle_click(request):
         x = data.get('x', 0)
         y = data.get('y', 0)
         
-        await checker.page.mouse.click(x, y)
+        try:
+            async with page_scheduler.acquire(ui_priority(), 'ui_click', timeout=UI_PAGE_TIMEOUT):
+                await checker.page.mouse.click(x, y)
+            screenshot_service.invalidate()
+        except asyncio.TimeoutError:
+            return web.json_response({'error': 'Browser busy', 'busy': page_scheduler.stats()['owner']}, status=503)
         print(f"Remote click: ({x}, {y})")
         
         return web.json_response({
@@ -740,7 +2686,9 @@ async def handle_click(request):
 async def handle_init(request):
     """API: Ініціалізувати браузер"""
     try:
-        await checker.init_browser()
+        with tracer.cycle('init'):
+            async with page_scheduler.acquire(PRIORITY_MANUAL, 'ui_init'):
+                await checker.init_browser()
         return web.json_response({
             'message': 'Браузер ініціалізовано успішно!',
             'success': True
@@ -754,11 +2702,13 @@ async def handle_init(request):
 async def handle_check(request):
     """API: Виконати перевірку"""
     try:
-        result = await checker.make_screenshots()
+        outcome = await check_coordinator.run('ui', max_age=CHECK_RESULT_TTL)
         return web.json_response({
             'message': 'Перевірка виконана успішно!',
             'success': True,
-            'update_date': result.get('update_date')
+            'update_date': outcome['result'].get('update_date'),
+            'today_changed': outcome['today_changed'],
+            'tomorrow_changed': outcome['tomorrow_changed']
         })
     except Exception as e:
         return web.json_response({
@@ -781,13 +2731,213 @@ async def handle_clear_cookies(request):
             'success': False
         }, status=500)
 
+def log_query(request):
+    """Параметри after/level/q запиту логів; after з Last-Event-ID має пріоритет (перепідключення SSE)"""
+    after = request.headers.get('Last-Event-ID') or request.query.get('after') or 0
+    try:
+        after = int(after)
+    except ValueError:
+        after = 0
+    level = request.query.get('level')
+    if level and level not in LOG_LEVELS:
+        raise web.HTTPBadRequest(text=f"level must be one of: {', '.join(LOG_LEVELS)}")
+    return after, level, request.query.get('q') or None
+
 async def handle_logs(request):
-    """API: Отримати останні логи"""
+    """API: Отримати логи після seq (?after=&level=&q=)"""
+    after, level, query = log_query(request)
+    return web.json_response({
+        'logs': log_buffer.since(after, level, query),
+        'last_seq': log_buffer.last_seq,
+        # Частина записів між after і першим у буфері вже витіснена
+        'truncated': after + 1 < log_buffer.first_seq(),
+        'timestamp': datetime.now(UKRAINE_TZ).isoformat()
+    })
+
+async def handle_logs_stream(request):
+    """SSE: нові записи логу з тими ж фільтрами, що й /api/logs"""
+    after, level, query = log_query(request)
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    await response.prepare(request)
+    
+    shutdown = request.app[SHUTDOWN_KEY]
+    try:
+        with log_buffer.watch() as event:
+            # Виходимо, коли клієнт відключився або сервер зупиняється (on_shutdown будить цикл);
+            # CancelledError від aiohttp проходить далі, watcher знімає with
+            while not shutdown.is_set() and request.transport is not None and not request.transport.is_closing():
+                event.clear()
+                entries = log_buffer.since(after, level, query)
+                if entries:
+                    after = entries[-1]['seq']
+                    await response.write(''.join(
+                        f"id: {entry['seq']}\ndata: {json.dumps(entry, ensure_ascii=False)}\n\n"
+                        for entry in entries
+                    ).encode('utf-8'))
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Коментар SSE тримає з'єднання живим через проксі
+                    await response.write(b': ping\n\n')
+    except ConnectionResetError:
+        # Клієнт закрив з'єднання посеред запису
+        pass
+    return response
+
+def chromium_rss_bytes():
+    """Сумарний RSS процесів Chromium з /proc (None якщо /proc недоступний)"""
+    if not os.path.isdir('/proc'):
+        return None
+    
+    total = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                exe = os.path.basename(f.read().split(b'\0', 1)[0])
+            if b'chrom' not in exe and b'headless_shell' not in exe:
+                continue
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except (OSError, ValueError):
+            continue
+    return total
+
+async def monitor_event_loop_lag(interval=1.0):
+    """Фонова задача: вимірює наскільки event loop запізнюється з пробудженням"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        metrics.set('dtek_event_loop_lag_seconds', max(0.0, loop.time() - started - interval))
+
+# Останній замір RSS: /proc скануємо не частіше ніж раз на CHROMIUM_RSS_INTERVAL секунд
+CHROMIUM_RSS_INTERVAL = 10
+chromium_rss_sampled_at = None
+
+async def sample_chromium_rss():
+    """Оновлює gauge RSS Chromium; обхід /proc іде в потоці, щоб не блокувати event loop"""
+    global chromium_rss_sampled_at
+    now = time.monotonic()
+    if chromium_rss_sampled_at is not None and now - chromium_rss_sampled_at < CHROMIUM_RSS_INTERVAL:
+        return
+    chromium_rss_sampled_at = now
+    rss = await asyncio.to_thread(chromium_rss_bytes)
+    if rss is not None:
+        metrics.set('dtek_chromium_rss_bytes', rss)
+
+async def handle_metrics(request):
+    """Метрики у текстовому форматі Prometheus"""
+    await sample_chromium_rss()
+    return web.Response(
+        text=metrics.render(),
+        content_type='text/plain',
+        headers={'X-Content-Type-Options': 'nosniff'}
+    )
+
+async def handle_trace(request):
+    """API: Таймінги етапів перевірок (p50/p95 і останні цикли)"""
+    try:
+        limit = int(request.query.get('limit', 10))
+    except ValueError:
+        limit = 10
+    
+    cycles = list(tracer.cycles)[-limit:] if limit > 0 else []
     return web.json_response({
-        'logs': list(log_buffer),
+        'stages': tracer.summary(),
+        'cycles': list(reversed(cycles)),
         'timestamp': datetime.now(UKRAINE_TZ).isoformat()
     })
 
+def _history_item(check):
+    """Перевірка з БД -> JSON для API"""
+    return {
+        'id': check['id'],
+        'update_date': check['update_date'],
+        'schedule_hash': check['schedule_hash'],
+        'schedule_tomorrow_hash': check['schedule_tomorrow_hash'],
+        'created_at': check['created_at'].isoformat() if check['created_at'] else None
+    }
+
+def _history_time(value):
+    """Час з параметрів запиту як naive UTC (так зберігається created_at); без зони - вже UTC"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(pytz.UTC).replace(tzinfo=None)
+    return moment
+
+async def handle_history(request):
+    """API: Історія перевірок (keyset-пагінація через cursor) або остання по кожній даті"""
+    if not db_pool:
+        return web.json_response({'error': 'База даних не підключена'}, status=503)
+    
+    query = request.query
+    try:
+        limit = int(query.get('limit', 50))
+        since = _history_time(query['since']) if 'since' in query else None
+        until = _history_time(query['until']) if 'until' in query else None
+        cursor = None
+        if 'cursor' in query:
+            created_at, check_id = query['cursor'].rsplit('_', 1)
+            cursor = (_history_time(created_at), int(check_id))
+        if limit < 1:
+            raise ValueError('limit')
+        if since and until and since >= until:
+            raise ValueError('since >= until')
+    except (ValueError, KeyError, OverflowError):
+        return web.json_response({'error': 'Невірні параметри'}, status=400)
+    
+    try:
+        async with db_pool.acquire() as conn:
+            if query.get('per_date'):
+                checks = await fetch_latest_per_date(conn, min(limit, HISTORY_PAGE_LIMIT))
+                next_cursor = None
+            else:
+                checks, next_cursor = await fetch_checks_page(conn, since, until, cursor, limit)
+    except asyncpg.DataError as e:
+        return web.json_response({'error': f'Невірні параметри: {e}'}, status=400)
+    except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError) as e:
+        log(f"❌ Помилка читання історії з БД: {e}")
+        return web.json_response({'error': 'Помилка бази даних'}, status=503)
+    
+    return web.json_response({
+        'items': [_history_item(check) for check in checks],
+        'next_cursor': f"{next_cursor[0].isoformat()}_{next_cursor[1]}" if next_cursor else None
+    })
+
+async def handle_versions(request):
+    """API: Версії графіка на дату (?date=YYYY-MM-DD, за замовчуванням - сьогодні)"""
+    if not db_pool:
+        return web.json_response({'error': 'База даних не підключена'}, status=503)
+    
+    try:
+        day = date_cls.fromisoformat(request.query['date']) if 'date' in request.query else datetime.now(UKRAINE_TZ).date()
+        limit = max(1, min(int(request.query.get('limit', 20)), HISTORY_PAGE_LIMIT))
+    except ValueError:
+        return web.json_response({'error': 'Невірні параметри'}, status=400)
+    
+    versions = await schedule_store.history(day, limit)
+    return web.json_response({
+        'date': day.isoformat(),
+        'versions': [
+            {
+                'version': version,
+                'hash': schedule.hash,
+                'outages': schedule.outages.labels(),
+                'created_at': created_at.isoformat() if created_at else None
+            }
+            for version, schedule, created_at in versions
+        ]
+    })
+
 async def handle_status(request):
     """API: Получити статус бота"""
     browser_status = "✅ Відкритий" if checker.browser else "✖️ Закритий"
@@ -796,7 +2946,16 @@ async def handle_status(request):
     return web.json_response({
         'browser': browser_status,
         'last_update': checker.last_update_date,
-        'cookies': cookies_status
+        'cookies': cookies_status,
+        'requests': checker.request_policy.stats(),
+        'images': image_pipeline.stats(),
+        'waits': checker.wait_summary(),
+        'diff_cache': diff_cache.stats(),
+        'schedule_versions': schedule_store.stats(),
+        'page': page_scheduler.stats(),
+        'checks': check_coordinator.stats(),
+        'screencast': screencast_hub.stats(),
+        'screenshots': screenshot_service.stats()
     })
 
 async def start_web_server():
@@ -805,21 +2964,226 @@ async def start_web_server():
     
     app.router.add_get('/', handle_root)
     app.router.add_get('/health', handle_health)
+    app.router.add_get('/metrics', handle_metrics)
     
     app.router.add_get('/api/screenshot', handle_screenshot)
+    app.router.add_get('/ws/screencast', handle_screencast)
     app.router.add_post('/api/click', handle_click)
     app.router.add_get('/api/init', handle_init)
     app.router.add_get('/api/check', handle_check)
     app.router.add_post('/api/clear-cookies', handle_clear_cookies)
     app.router.add_get('/api/status', handle_status)
     app.router.add_get('/api/logs', handle_logs)
+    app.router.add_get('/api/logs/stream', handle_logs_stream)
+    app.router.add_get('/api/trace', handle_trace)
+    app.router.add_get('/api/history', handle_history)
+    app.router.add_get('/api/versions', handle_versions)
+    
+    # Довгі з'єднання (SSE логів, трансляція) закриваємо до того, як runner чекає обробники
+    app[SHUTDOWN_KEY] = asyncio.Event()
+    app.on_shutdown.append(close_long_connections)
     
-    runner = web.AppRunner(app)
-    await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', PORT)
+    global web_runner
+    web_runner = web.AppRunner(app)
+    await web_runner.setup()
+    site = web.TCPSite(web_runner, '0.0.0.0', PORT)
     await site.start()
     log(f"✓ Web server started on port {PORT}")
 
+async def close_long_connections(app):
+    """on_shutdown: зупиняє SSE потоки логів і відключає глядачів трансляції"""
+    app[SHUTDOWN_KEY].set()
+    log_buffer.wake()
+    for ws in list(screencast_hub.viewers):
+        await ws.close(code=aiohttp.WSCloseCode.GOING_AWAY, message=b'Server shutdown')
+
+async def stop_web_server():
+    """Зупинка веб-сервера"""
+    global web_runner
+    if web_runner:
+        await web_runner.cleanup()
+        web_runner = None
+        log("✓ Веб-сервер зупинено")
+
+class RequestPolicy:
+    """Правила блокування запитів браузера за типом ресурсу і хостом"""
+    def __init__(self, enabled, deny_types, deny_hosts, allow_hosts):
+        self.enabled = enabled
+        self.deny_types = self._split(deny_types)
+        self.deny_hosts = self._split(deny_hosts)
+        self.allow_hosts = self._split(allow_hosts)
+        self.blocked = Counter()
+        self.allowed = 0
+
+    @staticmethod
+    def _split(value):
+        return {item.strip().lower() for item in value.split(',') if item.strip()}
+
+    @staticmethod
+    def _host_matches(host, hosts):
+        return any(host == h or host.endswith('.' + h) for h in hosts)
+
+    def block_reason(self, resource_type, host):
+        """Причина блокування ('host:...', 'type:...') або None якщо запит дозволено"""
+        host = (host or '').lower()
+        if self._host_matches(host, self.allow_hosts):
+            return None
+        if self._host_matches(host, self.deny_hosts):
+            return f"host:{host}"
+        if resource_type in self.deny_types:
+            return f"type:{resource_type}"
+        return None
+
+    def stats(self):
+        """Лічильники для веб-інтерфейсу"""
+        return {
+            'enabled': self.enabled,
+            'allowed': self.allowed,
+            'blocked_total': sum(self.blocked.values()),
+            'blocked': dict(self.blocked.most_common(20))
+        }
+
+class DTEKHttpFetcher:
+    """Легка перевірка графіка через HTTP з куками, які зберіг браузер"""
+    def __init__(self, cookies_file):
+        self.cookies_file = cookies_file
+        self.session = None
+        self.csrf_token = None
+        self.page_fact = None
+        self.cookies_mtime = None
+
+    async def _get_session(self):
+        """Повертає спільну ClientSession (створює при першому виклику)"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=4, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=30),
+                headers={'Accept-Language': 'uk-UA,uk;q=0.9'}
+            )
+            self.cookies_mtime = None
+        self._load_cookies()
+        return self.session
+
+    def _load_cookies(self):
+        """Підвантажує куки з файлу Playwright, якщо файл змінився"""
+        try:
+            if not os.path.exists(self.cookies_file):
+                return
+            mtime = os.path.getmtime(self.cookies_file)
+            if mtime == self.cookies_mtime:
+                return
+
+            with open(self.cookies_file, 'r') as f:
+                cookies = json.load(f)
+
+            for cookie in cookies:
+                domain = cookie.get('domain', '').lstrip('.')
+                if not domain:
+                    continue
+                self.session.cookie_jar.update_cookies(
+                    {cookie['name']: cookie['value']},
+                    response_url=URL(f"https://{domain}/")
+                )
+
+            self.cookies_mtime = mtime
+            self.csrf_token = None
+            print(f"✓ HTTP: завантажено {len(cookies)} кук")
+        except Exception as e:
+            print(f"⚠ HTTP: не вдалось завантажити куки: {e}")
+
+    def _has_captcha(self, text):
+        """Чи віддав сайт сторінку з капчею замість даних"""
+        return re.search(r'<iframe[^>]+src="[^"]*(captcha|checkbox)', text, re.IGNORECASE) is not None
+
+    async def _refresh_csrf(self, session, headers):
+        """Отримує CSRF токен і DisconSchedule.fact зі сторінки графіків"""
+        async with session.get(DTEK_SHUTDOWNS_URL, headers=headers) as response:
+            html = await response.text()
+
+        if self._has_captcha(html):
+            log("🧩 HTTP: сайт повернув капчу")
+            return False
+
+        match = re.search(r'<meta name="csrf-token" content="([^"]+)"', html)
+        if not match:
+            log("⚠️ HTTP: CSRF токен не знайдено")
+            return False
+
+        self.csrf_token = match.group(1)
+        self.page_fact = parse_page_fact(html)
+        return True
+
+    async def fetch(self, user_agent=None):
+        """Повертає {'update', 'payload', 'schedules'} або None, якщо потрібен браузер"""
+        try:
+            session = await self._get_session()
+            headers = {'User-Agent': user_agent} if user_agent else {}
+
+            page_loaded = False
+            if not self.csrf_token:
+                if not await self._refresh_csrf(session, headers):
+                    return None
+                page_loaded = True
+
+            form = {
+                'method': 'getHomeNum',
+                'data[0][name]': 'city',
+                'data[0][value]': DTEK_CITY,
+                'data[1][name]': 'street',
+                'data[1][value]': DTEK_STREET,
+                'data[2][name]': 'updateFact',
+                'data[2][value]': datetime.now(UKRAINE_TZ).strftime('%d.%m.%Y %H:%M'),
+            }
+            ajax_headers = dict(headers)
+            ajax_headers.update({
+                'X-Requested-With': 'XMLHttpRequest',
+                'X-CSRF-Token': self.csrf_token,
+                'Referer': DTEK_SHUTDOWNS_URL,
+            })
+
+            async with session.post(DTEK_AJAX_URL, data=form, headers=ajax_headers) as response:
+                status = response.status
+                text = await response.text()
+
+            if status in (403, 419):
+                log(f"⚠️ HTTP: сайт відхилив запит ({status})")
+                self.csrf_token = None
+                return None
+
+            if self._has_captcha(text):
+                log("🧩 HTTP: сайт повернув капчу")
+                return None
+
+            payload = json.loads(text)
+            if not isinstance(payload.get('fact'), dict):
+                # getHomeNum не завжди повертає fact - тоді, як і в браузері, беремо
+                # DisconSchedule.fact зі сторінки (свіжої, а не з кешу токена)
+                if not page_loaded and not await self._refresh_csrf(session, headers):
+                    return None
+                if self.page_fact:
+                    payload['fact'] = self.page_fact
+
+            schedules = parse_network_schedules(payload, DTEK_HOUSE)
+            if not schedules:
+                log("⚠️ HTTP: у відповіді немає графіка")
+                return None
+
+            update = payload.get('updateTimestamp') or (payload.get('fact') or {}).get('update')
+            return {
+                'update': update,
+                'payload': payload,
+                'schedules': schedules
+            }
+        except Exception as e:
+            log(f"⚠️ HTTP: помилка запиту: {e}")
+            return None
+
+    async def close(self):
+        """Закриття HTTP сесії"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
 class DTEKChecker:
     def __init__(self):
         self.browser = None
@@ -830,6 +3194,19 @@ class DTEKChecker:
         self.cookies_file = 'dtek_cookies.json'
         self.captcha_attempts = 0
         self.max_captcha_attempts = 3
+        self.schedule_source = SCHEDULE_SOURCE
+        self.network_payload = {}
+        self.network_payload_at = None
+        self.navigated_at = None
+        self.user_agent = None
+        self.http_fetcher = DTEKHttpFetcher(self.cookies_file)
+        self.http_signature = None
+        self.screenshot_mode = SCREENSHOT_MODE
+        self.wait_stats = {}
+        self.image_source = IMAGE_SOURCE
+        self.request_policy = RequestPolicy(
+            REQUEST_BLOCKING, BLOCK_RESOURCE_TYPES, BLOCK_HOSTS, ALLOW_HOSTS
+        )
     
     def _get_random_user_agent(self):
         user_agents = [
@@ -864,6 +3241,67 @@ class DTEKChecker:
     async def _random_delay(self, min_ms=100, max_ms=500):
         await asyncio.sleep(random.uniform(min_ms/1000, max_ms/1000))
     
+    def _record_wait(self, name, started, ok):
+        """Записує скільки фактично тривало очікування умови"""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stats = self.wait_stats.setdefault(name, {
+            'count': 0,
+            'timeouts': 0,
+            'timings': deque(maxlen=50)
+        })
+        stats['count'] += 1
+        stats['timings'].append(elapsed_ms)
+        if not ok:
+            stats['timeouts'] += 1
+        tracer.record(f"wait:{name}", started, 'ok' if ok else 'timeout')
+        return elapsed_ms
+
+    async def _wait_until(self, name, condition, arg=None, timeout=10000):
+        """Чекає JS умову на сторінці (не довше timeout мс) замість фіксованої паузи"""
+        started = time.perf_counter()
+        ok = True
+        try:
+            await self.page.wait_for_function(condition, arg=arg, timeout=timeout, polling=100)
+        except PlaywrightTimeoutError:
+            ok = False
+        except Exception as e:
+            ok = False
+            log(f"⚠️ Помилка очікування '{name}': {e}")
+        
+        elapsed_ms = self._record_wait(name, started, ok)
+        if not ok:
+            log(f"⏱️ Умова '{name}' не виконалась за {elapsed_ms / 1000:.1f} с")
+        return ok
+
+    async def _wait_network_idle(self, name, timeout=5000):
+        """Чекає поки на сторінці не буде мережевих запитів (не довше timeout мс)"""
+        started = time.perf_counter()
+        ok = True
+        try:
+            await self.page.wait_for_load_state('networkidle', timeout=timeout)
+        except Exception:
+            ok = False
+        self._record_wait(name, started, ok)
+        return ok
+
+    async def _wait_page_ready(self, name='page-ready', timeout=15000):
+        """Чекає поки на сторінці з'явиться форма пошуку або капча"""
+        return await self._wait_until(name, PAGE_READY_JS, timeout=timeout)
+
+    def wait_summary(self):
+        """Статистика очікувань для веб-інтерфейсу"""
+        summary = {}
+        for name, stats in self.wait_stats.items():
+            timings = stats['timings']
+            summary[name] = {
+                'count': stats['count'],
+                'timeouts': stats['timeouts'],
+                'last_ms': round(timings[-1], 1),
+                'avg_ms': round(sum(timings) / len(timings), 1),
+                'max_ms': round(max(timings), 1)
+            }
+        return summary
+
     async def _human_move_and_click(self, locator):
         """Більш людяноподібний клік з рухом миші"""
         try:
@@ -905,6 +3343,86 @@ class DTEKChecker:
         except:
             pass
     
+    async def _route_request(self, route):
+        """Блокує запити за RequestPolicy, решту пропускає далі"""
+        request = route.request
+        reason = self.request_policy.block_reason(
+            request.resource_type, urlsplit(request.url).hostname
+        )
+        if reason:
+            self.request_policy.blocked[reason] += 1
+            await route.abort()
+        else:
+            self.request_policy.allowed += 1
+            await route.continue_()
+
+    def _on_navigated(self, frame):
+        """Нова навігація: JSON попередньої сторінки вже не відповідає тому, що показано"""
+        if frame != self.page.main_frame:
+            return
+        self.navigated_at = datetime.now(UKRAINE_TZ)
+        self.network_payload = {}
+        self.network_payload_at = None
+
+    async def _on_response(self, response):
+        """Перехоплює AJAX відповіді сайту з даними графіка"""
+        try:
+            if '/ajax' not in response.url or response.request.method != 'POST':
+                return
+
+            data = await response.json()
+            if not isinstance(data, dict):
+                return
+
+            captured = False
+            if isinstance(data.get('data'), dict) and DTEK_HOUSE in data['data']:
+                self.network_payload['data'] = data['data']
+                captured = True
+            if isinstance(data.get('fact'), dict):
+                self.network_payload['fact'] = data['fact']
+                captured = True
+
+            if captured:
+                self.network_payload_at = datetime.now(UKRAINE_TZ)
+                log(f"📡 Перехоплено дані графіка з {response.url}")
+        except Exception as e:
+            log(f"⚠️ Не вдалось прочитати відповідь {response.url}: {e}")
+
+    async def _network_schedules(self):
+        """Графіки з перехопленого JSON (без парсингу таблиці)"""
+        payload = dict(self.network_payload)
+        if payload and self.navigated_at and (
+            self.network_payload_at is None or self.network_payload_at < self.navigated_at
+        ):
+            log("⚠️ Перехоплений JSON старіший за поточну сторінку - не використовую")
+            payload = {}
+
+        tab_dates = ()
+        if payload and self.page:
+            try:
+                tab_dates = await self.page.evaluate(TAB_DATES_JS)
+            except Exception as e:
+                log(f"⚠️ Не вдалось прочитати дати вкладок: {e}")
+
+        if 'fact' not in payload and self.page:
+            # Відповідь з будинками не завжди містить fact - тоді беремо
+            # його з об'єкта, з якого сайт сам рендерить таблицю
+            try:
+                fact = await self.page.evaluate(
+                    "() => (window.DisconSchedule && window.DisconSchedule.fact) || null"
+                )
+                if fact:
+                    payload['fact'] = fact
+            except Exception as e:
+                log(f"⚠️ Не вдалось отримати DisconSchedule.fact: {e}")
+
+        try:
+            return parse_network_schedules(payload, DTEK_HOUSE, tab_dates)
+        except Exception as e:
+            log(f"❌ Помилка парсингу JSON графіка: {e}")
+            return []
+
+    @tracer.traced('popup_close')
     async def _close_attention_popup(self):
         """Закриває спливаюче вікно "Шановні клієнти!" про відключення"""
         try:
@@ -915,7 +3433,7 @@ class DTEKChecker:
             if await close_btn.count() > 0 and await close_btn.is_visible():
                 log("✓ Знайдено спливаюче вікно - закриваю")
                 await self._human_move_and_click(close_btn)
-                await asyncio.sleep(1)
+                await self._wait_until('popup-closed', POPUP_CLOSED_JS, timeout=3000)
                 log("✓ Спливаюче вікно закрито")
                 return True
             
@@ -926,7 +3444,7 @@ class DTEKChecker:
                     if await close_x.is_visible(timeout=1000):
                         log("✓ Знайдено кнопку × - закриваю")
                         await self._human_move_and_click(close_x)
-                        await asyncio.sleep(1)
+                        await self._wait_until('popup-closed', POPUP_CLOSED_JS, timeout=3000)
                         log("✓ Вікно закрито через ×")
                         return True
                 except:
@@ -938,6 +3456,7 @@ class DTEKChecker:
             log(f"⚠️ Помилка закриття спливаючого вікна: {e}")
             return False
     
+    @tracer.traced('captcha_detect')
     async def _detect_captcha(self):
         """Виявлення ТІЛЬКИ реальної капчі (iframe recaptcha) - НЕ спливаючі вікна!"""
         try:
@@ -970,6 +3489,7 @@ class DTEKChecker:
         
         try:
             log("🧩 Початок обробки капчі...")
+            metrics.inc('dtek_captchas_seen_total')
             
             # Робимо скріншот капчі
             captcha_screenshot = await self.page.screenshot(type='png', full_page=False)
@@ -1009,7 +3529,9 @@ class DTEKChecker:
             
             # Чекаємо на вирішення
             log("⏳ Очікую вирішення капчі користувачем...")
-            await asyncio.wait_for(captcha_state.resolver_event.wait(), timeout=300)
+            # Поки користувач думає, сторінка вільна для веб-інтерфейсу
+            async with page_scheduler.released():
+                await asyncio.wait_for(captcha_state.resolver_event.wait(), timeout=300)
             
             if captcha_state.resolved:
                 log(f"✓ Користувач обрав {len(captcha_state.selected_images)} картинок")
@@ -1017,8 +3539,8 @@ class DTEKChecker:
                 # Клікаємо по обраним картинкам
                 await self._click_captcha_images(captcha_state.selected_images)
                 
-                # Чекаємо трохи
-                await asyncio.sleep(2)
+                # Чекаємо поки капча обробить вибір
+                await self._wait_network_idle('captcha-verify', timeout=5000)
                 
                 # Перевіряємо чи потрібен другий етап
                 still_captcha = await self._detect_captcha()
@@ -1048,17 +3570,19 @@ class DTEKChecker:
                     
                     await message.edit(embed=embed2, attachments=[file2], view=view2)
                     
-                    await asyncio.wait_for(captcha_state.resolver_event.wait(), timeout=300)
+                    async with page_scheduler.released():
+                        await asyncio.wait_for(captcha_state.resolver_event.wait(), timeout=300)
                     
                     if captcha_state.resolved:
                         await self._click_captcha_images(captcha_state.selected_images)
-                        await asyncio.sleep(2)
+                        await self._wait_network_idle('captcha-verify', timeout=5000)
                 
                 # Перевіряємо успішність
                 success = await self._verify_page_loaded()
                 
                 if success:
                     log("✅ Капча успішно пройдена!")
+                    metrics.inc('dtek_captchas_solved_total')
                     success_embed = discord.Embed(
                         title="✅ Капча пройдена!",
                         description="Сторінка успішно завантажена",
@@ -1122,7 +3646,7 @@ class DTEKChecker:
             if await verify_button.count() > 0:
                 log("✓ Натискаю кнопку перевірки")
                 await verify_button.click()
-                await asyncio.sleep(2)
+                await self._wait_network_idle('captcha-submit', timeout=5000)
                 
         except Exception as e:
             log(f"⚠️ Помилка кліку по капчі: {e}")
@@ -1220,6 +3744,7 @@ class DTEKChecker:
                 log("✓ Chromium запущено")
             
             user_agent = self._get_random_user_agent()
+            self.user_agent = user_agent
             
             self.context = await self.browser.new_context(
                 viewport={'width': 1920, 'height': 1080},
@@ -1229,6 +3754,10 @@ class DTEKChecker:
                 geolocation={'latitude': 50.4501, 'longitude': 30.5234},
             )
             
+            if self.request_policy.enabled:
+                await self.context.route('**/*', self._route_request)
+                log(f"✓ Блокування запитів: {', '.join(sorted(self.request_policy.deny_types))}")
+            
             await self.context.add_init_script("""
                 Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
                 window.navigator.chrome = { runtime: {} };
@@ -1236,26 +3765,78 @@ class DTEKChecker:
             """)
             
             self.page = await self.context.new_page()
+            self.page.on('response', self._on_response)
+            self.page.on('framenavigated', self._on_navigated)
+            # Глядачі, що вже підключені, бачать нову сторінку з самого початку
+            await screencast_hub.attach()
             await self._load_cookies()
             await self._setup_page()
             await self._save_cookies()
     
+    @tracer.traced('form_fill')
+    async def _fill_address_form(self):
+        """Заповнює місто, вулицю і будинок через автокомпліт"""
+        # Імітуємо людяноподібну поведінку перед заповненням
+        await self._random_mouse_movements()
+        await self._random_delay(500, 1000)
+        
+        # Вводимо місто
+        log("🏙 Вводжу місто...")
+        city_input = self.page.locator('.discon-input-wrapper #city')
+        await city_input.wait_for(state='visible', timeout=15000)
+        await self._human_move_and_click(city_input)
+        await city_input.clear()
+        await self._human_type(city_input, 'княж')
+        await self._wait_until('autocomplete-city', AUTOCOMPLETE_READY_JS, arg=['#cityautocomplete-list', 2], timeout=15000)
+        
+        city_option = self.page.locator('#cityautocomplete-list > div:nth-child(2)')
+        await city_option.wait_for(state='visible', timeout=15000)
+        await self._human_move_and_click(city_option)
+        await self._wait_until('street-enabled', INPUT_ENABLED_JS, arg='.discon-input-wrapper #street', timeout=10000)
+        
+        # Вводимо вулицю
+        log("🛣 Вводжу вулицю...")
+        street_input = self.page.locator('.discon-input-wrapper #street')
+        await street_input.wait_for(state='visible', timeout=15000)
+        await self._human_move_and_click(street_input)
+        await street_input.clear()
+        await self._human_type(street_input, 'київ')
+        await self._wait_until('autocomplete-street', AUTOCOMPLETE_READY_JS, arg=['#streetautocomplete-list', 2], timeout=15000)
+        
+        street_option = self.page.locator('#streetautocomplete-list > div:nth-child(2)')
+        await street_option.wait_for(state='visible', timeout=15000)
+        await self._human_move_and_click(street_option)
+        await self._wait_until('house-enabled', INPUT_ENABLED_JS, arg='input#house_num', timeout=10000)
+        
+        # Вводимо будинок
+        log("🏠 Вводжу будинок...")
+        house_input = self.page.locator('input#house_num')
+        await house_input.wait_for(state='visible', timeout=15000)
+        await self._human_move_and_click(house_input)
+        await house_input.clear()
+        await self._human_type(house_input, DTEK_HOUSE)
+        await self._wait_until('autocomplete-house', AUTOCOMPLETE_READY_JS, arg=['#house_numautocomplete-list', 1], timeout=15000)
+        
+        house_option = self.page.locator('#house_numautocomplete-list > div:first-child')
+        await house_option.wait_for(state='visible', timeout=15000)
+        await self._human_move_and_click(house_option)
+        await self._wait_until('table-rendered', TABLE_READY_JS, timeout=15000)
+
     async def _setup_page(self):
         """Налаштування сторінки з правильною обробкою вікон"""
         log("🔧 Налаштування сторінки...")
         
         channel = bot.get_channel(CHANNEL_ID)
         
-        await self.page.goto('https://www.dtek-krem.com.ua/ua/shutdowns', wait_until='domcontentloaded', timeout=90000)
-        await asyncio.sleep(5)
+        with tracer.span('goto'):
+            await self.page.goto(DTEK_SHUTDOWNS_URL, wait_until='domcontentloaded', timeout=90000)
+            await self._wait_page_ready('goto')
         
         # СПОЧАТКУ закриваємо спливаюче вікно "Шановні клієнти!"
         await self._close_attention_popup()
-        await asyncio.sleep(1)
         
         # Закриваємо опрос якщо є
         await self._close_survey_if_present()
-        await asyncio.sleep(1)
         
         # ТІЛЬКИ ТЕПЕР перевіряємо реальну капчу (iframe)
         has_captcha = await self._detect_captcha()
@@ -1276,7 +3857,7 @@ class DTEKChecker:
                 if self.captcha_attempts < self.max_captcha_attempts:
                     log("🔄 Перезавантажую сторінку для нової спроби...")
                     await self.page.reload(wait_until='domcontentloaded', timeout=30000)
-                    await asyncio.sleep(3)
+                    await self._wait_page_ready('reload')
                     await self._close_attention_popup()
                     await self._close_survey_if_present()
             
@@ -1284,54 +3865,7 @@ class DTEKChecker:
                 log("❌ Вичерпано всі спроби проходження капчі")
                 raise Exception("Не вдалось пройти капчу після всіх спроб")
         
-        # Імітуємо людяноподібну поведінку перед заповненням
-        await self._random_mouse_movements()
-        await self._random_delay(500, 1000)
-        
-        # Вводимо місто
-        log("🏙 Вводжу місто...")
-        city_input = self.page.locator('.discon-input-wrapper #city')
-        await city_input.wait_for(state='visible', timeout=15000)
-        await self._human_move_and_click(city_input)
-        await city_input.clear()
-        await asyncio.sleep(0.5)
-        await self._human_type(city_input, 'княж')
-        await asyncio.sleep(2)
-        
-        city_option = self.page.locator('#cityautocomplete-list > div:nth-child(2)')
-        await city_option.wait_for(state='visible', timeout=15000)
-        await self._human_move_and_click(city_option)
-        await asyncio.sleep(2)
-        
-        # Вводимо вулицю
-        log("🛣 Вводжу вулицю...")
-        street_input = self.page.locator('.discon-input-wrapper #street')
-        await street_input.wait_for(state='visible', timeout=15000)
-        await self._human_move_and_click(street_input)
-        await street_input.clear()
-        await asyncio.sleep(0.5)
-        await self._human_type(street_input, 'київ')
-        await asyncio.sleep(2)
-        
-        street_option = self.page.locator('#streetautocomplete-list > div:nth-child(2)')
-        await street_option.wait_for(state='visible', timeout=15000)
-        await self._human_move_and_click(street_option)
-        await asyncio.sleep(2)
-        
-        # Вводимо будинок
-        log("🏠 Вводжу будинок...")
-        house_input = self.page.locator('input#house_num')
-        await house_input.wait_for(state='visible', timeout=15000)
-        await self._human_move_and_click(house_input)
-        await house_input.clear()
-        await asyncio.sleep(0.5)
-        await self._human_type(house_input, '168')
-        await asyncio.sleep(2)
-        
-        house_option = self.page.locator('#house_numautocomplete-list > div:first-child')
-        await house_option.wait_for(state='visible', timeout=15000)
-        await self._human_move_and_click(house_option)
-        await asyncio.sleep(3)
+        await self._fill_address_form()
         
         await self._close_survey_if_present()
         
@@ -1349,6 +3883,7 @@ class DTEKChecker:
         log("✅ Сторінка налаштована!")
         await self._save_cookies()
 
+    @tracer.traced('check_for_update')
     async def check_for_update(self):
         """Перевіряє чи змінилась дата з обробкою помилок"""
         try:
@@ -1384,7 +3919,7 @@ class DTEKChecker:
                     # Якщо капчі немає, просто перезавантажуємо
                     log("🔄 Перезавантажую сторінку...")
                     await self.page.reload(wait_until='domcontentloaded', timeout=30000)
-                    await asyncio.sleep(3)
+                    await self._wait_page_ready('reload')
                     await self._close_attention_popup()
                     await self._close_survey_if_present()
                     await update_elem.wait_for(state='visible', timeout=15000)
@@ -1419,265 +3954,140 @@ class DTEKChecker:
             
             return False
 
+    async def _extract_schedule_dom(self):
+        """Витягує дати вкладок, заголовки і класи клітинок усіх таблиць одним page.evaluate"""
+        raw = await self.page.evaluate(SCHEDULE_EXTRACT_JS)
+        return ScheduleExtract(raw)
+
+    @tracer.traced('http_check')
+    async def http_check_for_update(self):
+        """Перевірка оновлення через HTTP: True/False, або None якщо потрібен браузер"""
+        log("🌐 Перевіряю оновлення через HTTP...")
+        result = await self.http_fetcher.fetch(self.user_agent)
+        if not result:
+            return None
+
+        signature = (
+            result['update'],
+            tuple(self._calculate_schedule_hash(schedule) for schedule in result['schedules'])
+        )
+        log(f"📅 HTTP: дата оновлення {result['update']}")
+
+        if self.schedule_source == 'network':
+            self.network_payload = {
+                'data': result['payload'].get('data'),
+                'fact': result['payload'].get('fact')
+            }
+            self.network_payload_at = datetime.now(UKRAINE_TZ)
+
+        previous = self.http_signature
+        self.http_signature = signature
+
+        if previous is None:
+            # Перший результат - лише базова точка, рішення приймає браузер
+            log("ℹ️ HTTP: перша перевірка, звіряюсь з браузером")
+            return None
+
+        if signature == previous:
+            log("ℹ️ HTTP: змін немає")
+            return False
+
+        log("🔔 HTTP: ОНОВЛЕННЯ ВИЯВЛЕНО!")
+        return True
+
+    @tracer.traced('parse_schedule')
     async def parse_schedule(self):
         """Парсить графік відключень з активної вкладки"""
         try:
-            date_elem = self.page.locator('.date.active')
-            schedule_date = await date_elem.text_content()
-            schedule_date = schedule_date.strip() if schedule_date else "Невідомо"
-            
-            result = {
-                'date': schedule_date,
-                'hours': [],
-                'schedule': {}
-            }
-            
-            for i in range(2, 26):
-                try:
-                    hour_selector = f'.active > table th:nth-child({i})'
-                    hour_elem = self.page.locator(hour_selector)
-                    hour_text = await hour_elem.text_content()
-                    hour_text = hour_text.strip()
-                    result['hours'].append(hour_text)
-                except:
-                    result['hours'].append(f"??:??")
-            
-            for i in range(2, 26):
-                try:
-                    cell_selector = f'.active > table td:nth-child({i})'
-                    cell_elem = self.page.locator(cell_selector)
-                    cell_class = await cell_elem.get_attribute('class')
-                    cell_class = cell_class.strip() if cell_class else ""
-                    
-                    hour = result['hours'][i-2]
-                    
-                    if 'cell-scheduled' in cell_class:
-                        status = 'scheduled'
-                    elif 'cell-non-scheduled' in cell_class:
-                        status = 'powered'
-                    elif 'cell-first-half' in cell_class:
-                        status = 'first-half'
-                    elif 'cell-second-half' in cell_class:
-                        status = 'second-half'
-                    else:
-                        status = 'powered'
-                    
-                    result['schedule'][hour] = {
-                        'status': status,
-                        'class': cell_class
-                    }
-                    
-                except Exception as e:
-                    hour = result['hours'][i-2] if i-2 < len(result['hours']) else "??:??"
-                    result['schedule'][hour] = {
-                        'status': 'error',
-                        'class': ''
-                    }
-            
-            return result
-            
+            extract = await self._extract_schedule_dom()
+            if not extract.has_table():
+                log("❌ Помилка парсингу: таблиця графіка не знайдена")
+                return None
+
+            return extract.to_schedule()
+
         except Exception as e:
             log(f"❌ Помилка парсингу: {e}")
             return None
 
     def _calculate_schedule_hash(self, schedule):
-        """Розраховує хеш графіка для порівняння"""
-        if not schedule:
-            return None
-        
-        status_string = ""
-        for hour in sorted(schedule['schedule'].keys()):
-            status_string += f"{hour}:{schedule['schedule'][hour]['status']};"
-        
-        return hashlib.md5(status_string.encode()).hexdigest()
+        """Хеш графіка для порівняння (рахується один раз у Schedule)"""
+        return schedule.hash if schedule else None
 
     def _has_any_outages(self, schedule):
         """Перевіряє чи є хоч одне відключення в графіку"""
-        if not schedule or not schedule.get('schedule'):
-            return False
-        
-        for hour_data in schedule['schedule'].values():
-            status = hour_data.get('status')
-            if status in ['scheduled', 'first-half', 'second-half']:
-                return True
-        
-        return False
+        return bool(schedule) and schedule.has_outages
 
     def _count_outage_hours(self, schedule):
-        """Підраховує кількість годин з відключенням"""
-        if not schedule or not schedule.get('schedule'):
-            return 0
-        
-        count = 0
-        for hour_data in schedule['schedule'].values():
-            status = hour_data.get('status')
-            if status in ['scheduled', 'first-half', 'second-half']:
-                count += 1
-        
-        return count
-
-    def _merge_consecutive_hours(self, hours_list):
-        """Об'єднує суміжні години в діапазони (наприклад: ['03-04', '04-05', '05-06'] -> '03-07')"""
-        if not hours_list:
-            return []
-        
-        # Сортуємо години
-        hours_list = sorted(hours_list)
-        
-        merged = []
-        current_start = None
-        current_end = None
-        
-        for hour_range in hours_list:
-            # Парсимо діапазон (наприклад "03-04")
-            try:
-                start, end = hour_range.split('-')
-                start_num = int(start.split(':')[0])
-                end_num = int(end.split(':')[0])
-                
-                if current_start is None:
-                    # Перший діапазон
-                    current_start = start
-                    current_end = end
-                    current_end_num = end_num
-                elif start_num == current_end_num:
-                    # Суміжний діапазон - продовжуємо
-                    current_end = end
-                    current_end_num = end_num
-                else:
-                    # Розрив - зберігаємо попередній і починаємо новий
-                    if current_start == current_end.split(':')[0]:
-                        merged.append(current_start)
-                    else:
-                        merged.append(f"{current_start}-{current_end}")
-                    current_start = start
-                    current_end = end
-                    current_end_num = end_num
-            except:
-                # Якщо не вдалось розпарсити - додаємо як є
-                if current_start:
-                    if current_start == current_end.split(':')[0]:
-                        merged.append(current_start)
-                    else:
-                        merged.append(f"{current_start}-{current_end}")
-                merged.append(hour_range)
-                current_start = None
-                current_end = None
-        
-        # Додаємо останній діапазон
-        if current_start:
-            # Перевіряємо чи початок і кінець однакові
-            start_hour = current_start.split(':')[0]
-            end_hour = current_end.split(':')[0]
-            if start_hour == end_hour:
-                merged.append(start_hour)
-            else:
-                merged.append(f"{start_hour}-{end_hour}")
-        
-        return merged
+        """Кількість годин з відключенням"""
+        return schedule.outage_count if schedule else 0
 
     def _compare_schedules(self, old_schedule, new_schedule):
-        """Порівнює два графіки і повертає текстовий опис змін"""
-        log("🔍 === ПОЧАТОК ПОРІВНЯННЯ ГРАФІКІВ ===")
-        
-        log(f"🔍 Тип old_schedule: {type(old_schedule)}")
-        log(f"🔍 Тип new_schedule: {type(new_schedule)}")
-        
-        if isinstance(old_schedule, str):
-            log("⚠️ old_schedule є рядком, парсимо JSON...")
-            try:
-                old_schedule = json.loads(old_schedule)
-                log("✓ JSON успішно розпарсено")
-            except Exception as e:
-                log(f"❌ Помилка парсингу JSON: {e}")
-                return "📊 Помилка парсингу старого графіка"
-        
-        if isinstance(new_schedule, str):
-            log("⚠️ new_schedule є рядком, парсимо JSON...")
-            try:
-                new_schedule = json.loads(new_schedule)
-                log("✓ JSON успішно розпарсено")
-            except Exception as e:
-                log(f"❌ Помилка парсингу JSON: {e}")
-                return "📊 Помилка парсингу нового графіка"
-        
+        """Порівнює два графіки і повертає текстовий опис змін (з кешу, якщо пару вже порівнювали)"""
         if not old_schedule or not new_schedule:
             log("⚠️ Один з графіків порожній")
             return "📊 Перша перевірка - немає з чим порівнювати"
         
-        if 'schedule' not in old_schedule:
-            log(f"❌ 'schedule' відсутній в old_schedule. Ключі: {old_schedule.keys()}")
-            return "📊 Некоректний формат старого графіка"
-        
-        if 'schedule' not in new_schedule:
-            log(f"❌ 'schedule' відсутній в new_schedule. Ключі: {new_schedule.keys()}")
-            return "📊 Некоректний формат нового графіка"
-        
-        log(f"✓ Кількість годин в старому графіку: {len(old_schedule['schedule'])}")
-        log(f"✓ Кількість годин в новому графіку: {len(new_schedule['schedule'])}")
-        
-        # Підраховуємо години з відключеннями
-        old_outage_count = self._count_outage_hours(old_schedule)
-        new_outage_count = self._count_outage_hours(new_schedule)
+        result, cached = diff_cache.get_or_compute(
+            'text', old_schedule, new_schedule,
+            lambda: self._diff_schedules(old_schedule, new_schedule)
+        )
+        if cached:
+            log(f"🔍 Порівняння {old_schedule.hash[:8]} → {new_schedule.hash[:8]} з кешу")
+        return result
+
+    def _diff_schedules(self, old_schedule, new_schedule):
+        """Рахує текстовий опис змін між двома графіками"""
+        log("🔍 === ПОЧАТОК ПОРІВНЯННЯ ГРАФІКІВ ===")
         
-        log(f"📊 Старий графік: {old_outage_count} годин без світла")
-        log(f"📊 Новий графік: {new_outage_count} годин без світла")
+        old_outages = old_schedule.outages
+        new_outages = new_schedule.outages
+        old_hours = old_outages.hours
+        new_hours = new_outages.hours
         
-        added_outages = []
-        removed_outages = []
+        log(f"📊 Старий графік: {format_hours(old_hours)} год без світла {old_outages.labels()}")
+        log(f"📊 Новий графік: {format_hours(new_hours)} год без світла {new_outages.labels()}")
         
-        for hour in new_schedule['schedule'].keys():
-            old_status = old_schedule['schedule'].get(hour, {}).get('status', 'unknown')
-            new_status = new_schedule['schedule'][hour]['status']
-            
-            if old_status != new_status:
-                log(f"🔄 Зміна в {hour}: {old_status} → {new_status}")
-            
-            if old_status in ['powered'] and new_status in ['scheduled', 'first-half', 'second-half']:
-                added_outages.append(hour)
-                log(f"⚡ {hour}: З'явилось відключення")
-            elif old_status in ['scheduled', 'first-half', 'second-half'] and new_status in ['powered']:
-                removed_outages.append(hour)
-                log(f"✅ {hour}: З'явилось світло")
+        # Порівнюємо тільки півгодини, статус яких відомий в обох графіках
+        comparable = old_schedule.known & new_schedule.known
+        added = (new_outages - old_outages) & comparable
+        removed = (old_outages - new_outages) & comparable
         
-        log(f"📊 Підсумок: додано відключень: {len(added_outages)}, прибрано: {len(removed_outages)}")
+        added_labels = added.labels()
+        removed_labels = removed.labels()
+        log(f"📊 Підсумок: додано відключень: {added_labels}, прибрано: {removed_labels}")
         
         # Формуємо підсумковий текст
-        if not added_outages and not removed_outages:
+        if not added and not removed:
             log("ℹ️ Графік не змінився")
             return None
         
-        # Об'єднуємо суміжні години
-        added_outages_merged = self._merge_consecutive_hours(added_outages)
-        removed_outages_merged = self._merge_consecutive_hours(removed_outages)
-        
-        log(f"📊 Об'єднані відключення додано: {added_outages_merged}")
-        log(f"📊 Об'єднані відключення прибрано: {removed_outages_merged}")
-        
         # Перевіряємо чи просто переставили
-        if len(added_outages) == len(removed_outages) and len(added_outages) > 0:
+        if len(added) == len(removed):
             result = f"🔄 **Переставили відключення**\n"
-            result += f"⚡ Тепер відключення: {', '.join(added_outages_merged)}\n"
-            result += f"✅ Тепер світло: {', '.join(removed_outages_merged)}"
+            result += f"⚡ Тепер відключення: {', '.join(added_labels)}\n"
+            result += f"✅ Тепер світло: {', '.join(removed_labels)}"
             log(f"✓ Результат: Переставили відключення")
         else:
             result_parts = []
             
-            if new_outage_count > old_outage_count:
-                diff = new_outage_count - old_outage_count
-                result_parts.append(f"⚡ **Годин без світла: +{diff}**")
-                if added_outages_merged:
-                    result_parts.append(f"Додалось відключення: {', '.join(added_outages_merged)}")
-            elif new_outage_count < old_outage_count:
-                diff = old_outage_count - new_outage_count
-                result_parts.append(f"✅ **Годин зі світлом: +{diff}**")
-                if removed_outages_merged:
-                    result_parts.append(f"З'явилось світло: {', '.join(removed_outages_merged)}")
+            if new_hours > old_hours:
+                result_parts.append(f"⚡ **Годин без світла: +{format_hours(new_hours - old_hours)}**")
+                if added_labels:
+                    result_parts.append(f"Додалось відключення: {', '.join(added_labels)}")
+                if removed_labels:
+                    result_parts.append(f"З'явилось світло: {', '.join(removed_labels)}")
+            elif new_hours < old_hours:
+                result_parts.append(f"✅ **Годин зі світлом: +{format_hours(old_hours - new_hours)}**")
+                if removed_labels:
+                    result_parts.append(f"З'явилось світло: {', '.join(removed_labels)}")
+                if added_labels:
+                    result_parts.append(f"Додалось відключення: {', '.join(added_labels)}")
             else:
-                if added_outages_merged:
-                    result_parts.append(f"⚡ Додалось відключення: {', '.join(added_outages_merged)}")
-                if removed_outages_merged:
-                    result_parts.append(f"✅ З'явилось світло: {', '.join(removed_outages_merged)}")
+                if added_labels:
+                    result_parts.append(f"⚡ Додалось відключення: {', '.join(added_labels)}")
+                if removed_labels:
+                    result_parts.append(f"✅ З'явилось світло: {', '.join(removed_labels)}")
             
             result = "\n".join(result_parts)
         
@@ -1686,38 +4096,55 @@ class DTEKChecker:
         
         return result
 
-    def crop_screenshot(self, screenshot_bytes, top_crop=300, bottom_crop=400, left_crop=0, right_crop=0):
-        """Обрізає скріншот"""
+    async def crop_screenshot(self, screenshot_bytes, top_crop=300, bottom_crop=400, left_crop=0, right_crop=0):
+        """Обрізає скріншот (у пулі обробки зображень)"""
         try:
-            image = Image.open(io.BytesIO(screenshot_bytes))
-            width, height = image.size
-            
-            left = left_crop
-            top = top_crop
-            right = width - right_crop
-            bottom = height - bottom_crop
+            cropped, size, box = await image_pipeline.run(
+                'crop', crop_image, screenshot_bytes, top_crop, bottom_crop, left_crop, right_crop
+            )
+            left, top, right, bottom = box
             
-            log(f"✂️ Обрізаю скріншот: {width}x{height} -> {right-left}x{bottom-top}")
+            log(f"✂️ Обрізаю скріншот: {size[0]}x{size[1]} -> {right-left}x{bottom-top}")
             log(f"   Координати: left={left}, top={top}, right={right}, bottom={bottom}")
             
-            cropped = image.crop((left, top, right, bottom))
-            
-            output = io.BytesIO()
-            cropped.save(output, format='PNG', optimize=True, quality=95)
-            return output.getvalue()
+            return cropped
         except Exception as e:
             log(f"⚠ Помилка при обрізці скріншота: {e}")
             return screenshot_bytes
 
-    async def _make_screenshot_with_retry(self, max_attempts=2):
+    async def _schedule_region(self):
+        """Знаходить область графіка (вкладки дат + таблиця) в координатах сторінки"""
+        try:
+            return await self.page.evaluate(SCHEDULE_REGION_JS, SCREENSHOT_PADDING)
+        except Exception as e:
+            log(f"⚠️ Не вдалось визначити область графіка: {e}")
+            return None
+
+    async def _capture_schedule(self):
+        """Скріншот графіка: тільки область таблиці, або повна сторінка з обрізкою"""
+        if self.screenshot_mode == 'element':
+            clip = await self._schedule_region()
+            if clip:
+                log(f"✂️ Область графіка: {clip['width']:.0f}x{clip['height']:.0f} @ ({clip['x']:.0f}, {clip['y']:.0f})")
+                return await self._make_screenshot_with_retry(max_attempts=2, clip=clip)
+            log("⚠️ Область графіка не знайдена - роблю повний скріншот")
+        
+        screenshot = await self._make_screenshot_with_retry(max_attempts=2)
+        # Обрізаємо за точними координатами
+        cropped = await self.crop_screenshot(screenshot, top_crop=300, bottom_crop=1579, left_crop=775, right_crop=315)
+        log(f"✓ Скріншот обрізано ({len(cropped)} байт)")
+        return cropped
+
+    async def _make_screenshot_with_retry(self, max_attempts=2, clip=None):
         """Робить скріншот з повторними спробами"""
         for attempt in range(1, max_attempts + 1):
             try:
                 log(f"📸 Спроба {attempt}/{max_attempts} зробити скріншот...")
-                screenshot = await asyncio.wait_for(
-                    self.page.screenshot(full_page=True, type='png'),
-                    timeout=60
-                )
+                with tracer.span('screenshot'):
+                    screenshot = await asyncio.wait_for(
+                        self.page.screenshot(full_page=True, type='png', clip=clip),
+                        timeout=60
+                    )
                 log(f"✓ Скріншот отримано ({len(screenshot)} байт)")
                 return screenshot
             except asyncio.TimeoutError:
@@ -1727,7 +4154,7 @@ class DTEKChecker:
                     await asyncio.sleep(3)
                     try:
                         await self.page.reload(wait_until='domcontentloaded', timeout=30000)
-                        await asyncio.sleep(2)
+                        await self._wait_page_ready('reload')
                         log("✓ Сторінка оновлена")
                     except:
                         log("⚠️ Не вдалось оновити сторінку")
@@ -1750,7 +4177,6 @@ class DTEKChecker:
             log("🔍 Перевіряю наявність вікон...")
             await self._close_attention_popup()
             await self._close_survey_if_present()
-            await asyncio.sleep(0.5)
             
             # СЬОГОДНІ
             log("")
@@ -1758,10 +4184,22 @@ class DTEKChecker:
             log("📊 ПАРСИНГ ГРАФІКА НА СЬОГОДНІ")
             log("="*50)
             
-            log("📋 Парсю графік на сьогодні...")
-            schedule_today = await self.parse_schedule()
+            network_schedules = []
+            if self.schedule_source == 'network':
+                log("📡 Беру графіки з перехопленого JSON...")
+                network_schedules = await self._network_schedules()
+                if network_schedules:
+                    log(f"✓ З JSON отримано графіків: {len(network_schedules)}")
+                else:
+                    log("⚠️ JSON графіка недоступний - парсю таблицю")
+            
+            if network_schedules:
+                schedule_today = network_schedules[0]
+            else:
+                log("📋 Парсю графік на сьогодні...")
+                schedule_today = await self.parse_schedule()
             if schedule_today:
-                log(f"✓ Графік розпарсено: {len(schedule_today.get('schedule', {}))} годин")
+                log(f"✓ Графік розпарсено: {len(schedule_today.hours)} годин")
             else:
                 log("❌ Не вдалось розпарсити графік")
             
@@ -1773,16 +4211,18 @@ class DTEKChecker:
             except Exception as e:
                 log(f"⚠️ Таблиця не знайдена: {e}")
             
-            log("📸 Роблю скріншот основного графіка...")
-            try:
-                screenshot_main = await self._make_screenshot_with_retry(max_attempts=2)
-            except Exception as e:
-                log(f"❌ Критична помилка при створенні скріншота: {e}")
-                raise
-            
-            # Обрізаємо за точними координатами
-            screenshot_main_cropped = self.crop_screenshot(screenshot_main, top_crop=300, bottom_crop=1579, left_crop=775, right_crop=315)
-            log(f"✓ Скріншот обрізано ({len(screenshot_main_cropped)} байт)")
+            screenshot_main_cropped = None
+            if self.image_source == 'render':
+                log("🎨 Зображення графіка буде намальовано локально")
+            else:
+                log("📸 Роблю скріншот основного графіка...")
+                try:
+                    screenshot_main_cropped = await self._capture_schedule()
+                except Exception as e:
+                    if not schedule_today:
+                        log(f"❌ Критична помилка при створенні скріншота: {e}")
+                        raise
+                    log(f"⚠️ Скріншот не вдався ({e}) - графік буде намальовано локально")
             
             # ЗАВТРА
             log("")
@@ -1794,53 +4234,62 @@ class DTEKChecker:
             screenshot_tomorrow_cropped = None
             schedule_tomorrow = None
             
-            try:
-                log("🔍 Шукаю другий графік...")
-                date_selector = self.page.locator('div.date:nth-child(2)')
-                await date_selector.wait_for(state='visible', timeout=15000)
-                
-                second_date = await date_selector.text_content()
-                second_date = second_date.strip()
-                log(f"📅 Дата другого графіка: {second_date}")
+            if self.image_source == 'render' and len(network_schedules) > 1:
+                # Графік і дата вже є в JSON, а скріншот не потрібен - вкладку не перемикаємо
+                schedule_tomorrow = network_schedules[1]
+                second_date = schedule_tomorrow.date
+                log(f"✓ Графік на завтра ({second_date}) взято з JSON")
+            else:
+                try:
+                    log("🔍 Шукаю другий графік...")
+                    date_selector = self.page.locator('div.date:nth-child(2)')
+                    await date_selector.wait_for(state='visible', timeout=15000)
                 
-                log("🖱️ Клікаю на другий графік...")
-                await self._human_move_and_click(date_selector)
-                log("⏳ Чекаю завантаження (2 сек)...")
-                await asyncio.sleep(2)
+                    second_date = await date_selector.text_content()
+                    second_date = second_date.strip()
+                    log(f"📅 Дата другого графіка: {second_date}")
                 
-                log("🔍 Перевіряю опрос після перемикання...")
-                await self._close_survey_if_present()
+                    log("🖱️ Клікаю на другий графік...")
+                    await self.page.evaluate(TAB_MARK_JS)
+                    await self._human_move_and_click(date_selector)
+                    log("⏳ Чекаю перемикання вкладки...")
+                    await self._wait_until('tab-switch', TAB_ACTIVE_JS, arg=second_date, timeout=10000)
                 
-                log("📋 Парсю графік на завтра...")
-                schedule_tomorrow = await self.parse_schedule()
-                if schedule_tomorrow:
-                    log(f"✓ Графік розпарсено: {len(schedule_tomorrow.get('schedule', {}))} годин")
+                    log("🔍 Перевіряю опрос після перемикання...")
+                    await self._close_survey_if_present()
                 
-                log("📸 Роблю скріншот другого графіка...")
-                try:
-                    screenshot_tomorrow = await self._make_screenshot_with_retry(max_attempts=2)
-                except asyncio.TimeoutError:
-                    log("❌ Таймаут при створенні скріншота завтра після всіх спроб")
-                    screenshot_tomorrow = None
-                except Exception as e:
-                    log(f"❌ Помилка скріншота завтра: {e}")
-                    screenshot_tomorrow = None
+                    if len(network_schedules) > 1:
+                        schedule_tomorrow = network_schedules[1]
+                    else:
+                        log("📋 Парсю графік на завтра...")
+                        schedule_tomorrow = await self.parse_schedule()
+                    if schedule_tomorrow:
+                        log(f"✓ Графік розпарсено: {len(schedule_tomorrow.hours)} годин")
                 
-                if screenshot_tomorrow:
-                    screenshot_tomorrow_cropped = self.crop_screenshot(screenshot_tomorrow, top_crop=300, bottom_crop=1579, left_crop=775, right_crop=315)
-                    log(f"✓ Скріншот обрізано ({len(screenshot_tomorrow_cropped)} байт)")
+                    if self.image_source != 'render':
+                        log("📸 Роблю скріншот другого графіка...")
+                        try:
+                            screenshot_tomorrow_cropped = await self._capture_schedule()
+                        except asyncio.TimeoutError:
+                            log("❌ Таймаут при створенні скріншота завтра після всіх спроб")
+                            screenshot_tomorrow_cropped = None
+                        except Exception as e:
+                            log(f"❌ Помилка скріншота завтра: {e}")
+                            screenshot_tomorrow_cropped = None
                 
-                log("🔙 Повертаюсь на перший графік...")
-                first_date = self.page.locator('div.date:nth-child(1)')
-                await first_date.wait_for(state='visible', timeout=10000)
-                await self._human_move_and_click(first_date)
-                await asyncio.sleep(2)
-                log(f"✓ Повернувся на перший графік")
+                    log("🔙 Повертаюсь на перший графік...")
+                    first_date = self.page.locator('div.date:nth-child(1)')
+                    await first_date.wait_for(state='visible', timeout=10000)
+                    first_date_text = (await first_date.text_content() or '').strip()
+                    await self.page.evaluate(TAB_MARK_JS)
+                    await self._human_move_and_click(first_date)
+                    await self._wait_until('tab-switch', TAB_ACTIVE_JS, arg=first_date_text, timeout=10000)
+                    log(f"✓ Повернувся на перший графік")
                 
-            except asyncio.TimeoutError:
-                log(f"⚠ Таймаут при роботі зі другим графіком")
-            except Exception as e:
-                log(f"⚠ Не вдалось отримати другий графік: {e}")
+                except asyncio.TimeoutError:
+                    log(f"⚠ Таймаут при роботі зі другим графіком")
+                except Exception as e:
+                    log(f"⚠ Не вдалось отримати другий графік: {e}")
             
             log("")
             log("="*50)
@@ -1865,6 +4314,8 @@ class DTEKChecker:
 
     async def close_browser(self):
         """Закриття браузера"""
+        await screencast_hub.detach()
+        screenshot_service.frames.clear()
         if self.page:
             await self.page.close()
         if self.context:
@@ -1878,6 +4329,9 @@ class DTEKChecker:
         self.context = None
         self.browser = None
         self.playwright = None
+        self.network_payload = {}
+        self.network_payload_at = None
+        self.navigated_at = None
         log("✓ Браузер закрито")
     
     async def restart_browser(self):
@@ -1907,144 +4361,613 @@ class DTEKChecker:
 
 checker = DTEKChecker()
 
-async def get_last_check():
-    """Отримує дані останньої перевірки з БД"""
-    try:
-        log("📂 Читаю останню перевірку з БД...")
-        async with db_pool.acquire() as conn:
-            # Спочатку перевіряємо які колонки існують
-            columns_check = await conn.fetch("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = 'dtek_checks'
-            """)
-            existing_columns = [row['column_name'] for row in columns_check]
-            log(f"🔍 Наявні колонки в БД: {existing_columns}")
-            
-            has_tomorrow_cols = 'schedule_tomorrow_hash' in existing_columns and 'schedule_tomorrow_data' in existing_columns
-            
-            # Формуємо запит залежно від наявності колонок
-            if has_tomorrow_cols:
-                query = '''
-                    SELECT update_date, schedule_hash, schedule_data, 
-                           schedule_tomorrow_hash, schedule_tomorrow_data, created_at 
-                    FROM dtek_checks 
-                    ORDER BY created_at DESC LIMIT 1
-                '''
-            else:
-                query = '''
-                    SELECT update_date, schedule_hash, schedule_data, created_at 
-                    FROM dtek_checks 
-                    ORDER BY created_at DESC LIMIT 1
-                '''
-                log("⚠️ Стара структура БД (без колонок для графіка завтра)")
+# Репозиторій історії перевірок. Всі вибірки йдуть по індексах (created_at DESC, id DESC)
+# і (update_date, created_at DESC, id DESC) з міграції 3, тому не деградують з ростом таблиці
+HISTORY_PAGE_LIMIT = 200
+
+def _check_columns():
+    """Колонки dtek_checks для SELECT з урахуванням можливостей схеми"""
+    columns = 'id, update_date, schedule_hash, schedule_data, created_at'
+    if db_capabilities['tomorrow_columns']:
+        columns += ', schedule_tomorrow_hash, schedule_tomorrow_data'
+    if db_capabilities['compact_columns']:
+        columns += ', ' + ', '.join(sorted(COMPACT_COLUMNS))
+    return columns
+
+def _schedule_from_row(row, prefix):
+    """Графік з компактних колонок, а для старих записів - з JSONB"""
+    mask = row.get(f'{prefix}_mask')
+    if mask is not None:
+        return Schedule.from_mask(row[f'{prefix}_date'], mask, row[f'{prefix}_unknown'] or 0)
+    data = row.get(f'{prefix}_data')
+    # JSONB null або рядок у старих записах - графіка немає
+    return Schedule.from_dict(data) if isinstance(data, dict) and data else None
+
+def _check_from_row(row):
+    """Рядок dtek_checks -> словник перевірки"""
+    result = {
+        'id': row['id'],
+        'update_date': row['update_date'],
+        'schedule_hash': row['schedule_hash'],
+        'schedule_data': _schedule_from_row(row, 'schedule'),
+        'schedule_tomorrow_hash': None,
+        'schedule_tomorrow_data': None,
+        'created_at': row['created_at']
+    }
+    schedule_tomorrow = _schedule_from_row(row, 'schedule_tomorrow')
+    if schedule_tomorrow:
+        result['schedule_tomorrow_hash'] = row.get('schedule_tomorrow_hash')
+        result['schedule_tomorrow_data'] = schedule_tomorrow
+    return result
+
+async def fetch_latest_check(conn):
+    """Остання перевірка (один index scan)"""
+    row = await conn.fetchrow(f'''
+        SELECT {_check_columns()}
+        FROM dtek_checks
+        ORDER BY created_at DESC, id DESC
+        LIMIT 1
+    ''')
+    return _check_from_row(row) if row else None
+
+async def fetch_latest_per_date(conn, limit=10):
+    """Остання перевірка для кожної дати оновлення, новіші першими.
+    
+    Рекурсивно йде по індексу (created_at DESC, id DESC) від найновішого запису і
+    зупиняється, щойно зібрано limit різних дат: перший запис дати на цьому шляху -
+    її остання перевірка. Записів переглядається стільки, скільки їх між цими датами.
+    """
+    rows = await conn.fetch(f'''
+        WITH RECURSIVE walk AS (
+            (SELECT id, created_at, ARRAY[update_date] AS seen, 1 AS found, TRUE AS first_seen
+             FROM dtek_checks
+             WHERE update_date IS NOT NULL
+             ORDER BY created_at DESC, id DESC
+             LIMIT 1)
+            UNION ALL
+            SELECT older.id, older.created_at,
+                   CASE WHEN older.seen THEN walk.seen ELSE walk.seen || older.update_date END,
+                   walk.found + CASE WHEN older.seen THEN 0 ELSE 1 END,
+                   NOT older.seen
+            FROM walk
+            CROSS JOIN LATERAL (
+                SELECT c.id, c.created_at, c.update_date, c.update_date = ANY(walk.seen) AS seen
+                FROM dtek_checks c
+                WHERE c.update_date IS NOT NULL
+                  AND (c.created_at, c.id) < (walk.created_at, walk.id)
+                ORDER BY c.created_at DESC, c.id DESC
+                LIMIT 1
+            ) older
+            WHERE walk.found < $1
+        )
+        SELECT {_check_columns()}
+        FROM dtek_checks
+        WHERE id IN (SELECT id FROM walk WHERE first_seen)
+        ORDER BY created_at DESC, id DESC
+    ''', limit)
+    return [_check_from_row(row) for row in rows]
+
+async def fetch_checks_page(conn, since=None, until=None, cursor=None, limit=50):
+    """Перевірки за проміжок часу, новіші першими, з keyset-пагінацією.
+    
+    cursor - пара (created_at, id) останнього елемента попередньої сторінки.
+    Повертає (перевірки, cursor наступної сторінки або None).
+    """
+    limit = max(1, min(limit, HISTORY_PAGE_LIMIT))
+    conditions = []
+    args = []
+    
+    if since is not None:
+        args.append(since)
+        conditions.append(f'created_at >= ${len(args)}')
+    if until is not None:
+        args.append(until)
+        conditions.append(f'created_at < ${len(args)}')
+    if cursor is not None:
+        args.extend(cursor)
+        conditions.append(f'(created_at, id) < (${len(args) - 1}, ${len(args)})')
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    args.append(limit + 1)
+    rows = await conn.fetch(f'''
+        SELECT {_check_columns()}
+        FROM dtek_checks
+        {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ${len(args)}
+    ''', *args)
+    
+    checks = [_check_from_row(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = checks[-1]
+        next_cursor = (last['created_at'], last['id'])
+    return checks, next_cursor
+
+class ScheduleVersionStore:
+    """Історія версій графіка для кожної дати графіка (замість слотів сьогодні/завтра)"""
+    
+    def __init__(self, keep_days=3):
+        self.keep_days = keep_days
+        # Остання версія по датах: {дата: (версія, Schedule або None)}
+        self.latest_versions = {}
+        self.hits = 0
+        self.misses = 0
+    
+    async def _latest_version(self, day):
+        if day in self.latest_versions:
+            self.hits += 1
+            return self.latest_versions[day]
+        
+        self.misses += 1
+        with tracer.span('db_read'):
+            async with db_pool.acquire() as conn:
+                row = await conn.fetchrow('''
+                    SELECT version, date_text, schedule_mask, schedule_unknown
+                    FROM schedule_versions
+                    WHERE schedule_day = $1
+                    ORDER BY version DESC
+                    LIMIT 1
+                ''', day)
+        
+        latest = (0, None)
+        if row:
+            latest = (row['version'], Schedule.from_mask(row['date_text'], row['schedule_mask'], row['schedule_unknown']))
+        self.latest_versions[day] = latest
+        return latest
+    
+    async def latest(self, day):
+        """Остання збережена версія графіка на дату (None - графіка на цю дату ще не було)"""
+        try:
+            return (await self._latest_version(day))[1]
+        except Exception as e:
+            log(f"❌ Помилка читання версій графіка на {day}: {e}")
+            return None
+    
+    async def warm(self):
+        """Один раз при старті читає з БД версії на сьогодні і завтра; далі їх оновлює record()"""
+        today = datetime.now(UKRAINE_TZ).date()
+        for day in (today, today + timedelta(days=1)):
+            schedule = await self.latest(day)
+            state = f"версія {self.latest_versions[day][0]}" if schedule else "ще немає"
+            log(f"🗂️ Графік на {day:%d.%m.%Y}: {state}")
+    
+    async def record(self, day, schedule, update_date=None, created_at=None):
+        """Зберігає нову версію, якщо графік на цю дату змінився. Повертає номер версії"""
+        try:
+            version, previous = await self._latest_version(day)
+            if schedule.same_as(previous):
+                return version
             
-            row = await conn.fetchrow(query)
+            created_at = created_at or datetime.now(UKRAINE_TZ).astimezone(pytz.UTC).replace(tzinfo=None)
+            with tracer.span('db_write'):
+                async with db_pool.acquire() as conn:
+                    inserted = await conn.fetchval('''
+                        INSERT INTO schedule_versions
+                            (schedule_day, version, schedule_hash, date_text, schedule_mask, schedule_unknown, update_date, created_at)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                        ON CONFLICT (schedule_day, version) DO NOTHING
+                        RETURNING version
+                    ''', day, version + 1, schedule.hash, schedule.date, schedule.mask, schedule.unknown, update_date, created_at)
             
-            if row:
-                log(f"✓ Знайдено запис від {row['created_at']}")
-                
-                schedule_data = row['schedule_data']
-                log(f"🔍 Тип даних з БД: schedule_data={type(schedule_data)}")
-                
-                if isinstance(schedule_data, str):
-                    log("⚠️ schedule_data є рядком, парсимо JSON...")
-                    try:
-                        schedule_data = json.loads(schedule_data)
-                        log(f"✓ JSON розпарсено")
-                    except Exception as e:
-                        log(f"❌ Помилка парсингу JSON: {e}")
-                        return None
-                
-                result = {
-                    'update_date': row['update_date'],
-                    'schedule_hash': row['schedule_hash'],
-                    'schedule_data': schedule_data,
-                    'schedule_tomorrow_hash': None,
-                    'schedule_tomorrow_data': None,
-                    'created_at': row['created_at']
-                }
-                
-                # Додаємо дані завтра якщо є
-                if has_tomorrow_cols and row.get('schedule_tomorrow_data'):
-                    schedule_tomorrow_data = row['schedule_tomorrow_data']
-                    if isinstance(schedule_tomorrow_data, str):
-                        log("⚠️ schedule_tomorrow_data є рядком, парсимо JSON...")
-                        try:
-                            schedule_tomorrow_data = json.loads(schedule_tomorrow_data)
-                            log(f"✓ JSON розпарсено")
-                        except Exception as e:
-                            log(f"❌ Помилка парсингу JSON: {e}")
-                            schedule_tomorrow_data = None
-                    
-                    result['schedule_tomorrow_hash'] = row.get('schedule_tomorrow_hash')
-                    result['schedule_tomorrow_data'] = schedule_tomorrow_data
-                
-                log(f"✓ Повертаю дані: update_date={result['update_date']}, has_tomorrow={result['schedule_tomorrow_hash'] is not None}")
-                return result
-            else:
-                log("ℹ️ Записів в БД не знайдено")
+            if inserted is None:
+                # Версію вже записав інший процес - перечитаємо при наступному зверненні
+                self.latest_versions.pop(day, None)
                 return None
-    except Exception as e:
-        log(f"❌ Помилка при отриманні даних з БД: {e}")
-        import traceback
-        log(f"Stack trace: {traceback.format_exc()}")
-    return None
+            
+            self.latest_versions[day] = (inserted, schedule)
+            self._prune(day)
+            log(f"🗂️ Графік на {day:%d.%m.%Y}: збережено версію {inserted}")
+            return inserted
+        except Exception as e:
+            self.latest_versions.pop(day, None)
+            log(f"❌ Помилка збереження версії графіка на {day}: {e}")
+            return None
+    
+    async def history(self, day, limit=20):
+        """Версії графіка на дату, новіші першими: [(версія, Schedule, created_at), ...]"""
+        with tracer.span('db_read'):
+            async with db_pool.acquire() as conn:
+                rows = await conn.fetch('''
+                    SELECT version, date_text, schedule_mask, schedule_unknown, created_at
+                    FROM schedule_versions
+                    WHERE schedule_day = $1
+                    ORDER BY version DESC
+                    LIMIT $2
+                ''', day, limit)
+        return [
+            (row['version'], Schedule.from_mask(row['date_text'], row['schedule_mask'], row['schedule_unknown']), row['created_at'])
+            for row in rows
+        ]
+    
+    def _prune(self, newest_day):
+        """Старі дати з пам'яті прибираємо - порівнюються тільки поточні"""
+        for day in list(self.latest_versions):
+            if (newest_day - day).days > self.keep_days:
+                del self.latest_versions[day]
+    
+    async def seed_from_checks(self, conn):
+        """Перший запуск: переносить графіки з останньої перевірки dtek_checks у версії"""
+        if await conn.fetchval('SELECT EXISTS (SELECT 1 FROM schedule_versions)'):
+            return
+        
+        check = await fetch_latest_check(conn)
+        if not check or not check['schedule_data']:
+            return
+        
+        # Слоти сьогодні/завтра відносяться до дня, коли перевірку записали
+        created_at = check['created_at']
+        base = pytz.UTC.localize(created_at).astimezone(UKRAINE_TZ).date() if created_at else None
+        slots = [(check['schedule_data'], 0), (check['schedule_tomorrow_data'], 1)]
+        for schedule, offset in slots:
+            if schedule:
+                day = schedule_day(schedule, offset, base)
+                await self.record(day, schedule, check['update_date'], created_at)
+    
+    def stats(self):
+        return {
+            'days': sorted(day.isoformat() for day in self.latest_versions),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+schedule_store = ScheduleVersionStore()
 
 async def save_check(update_date, schedule_hash, schedule_data, schedule_tomorrow_hash=None, schedule_tomorrow_data=None):
-    """Зберігає дані перевірки в БД"""
+    """Зберігає дані перевірки (графіки - Schedule) в БД"""
     try:
         log(f"💾 Зберігаю в БД:")
         log(f"  📅 update_date: {update_date}")
         log(f"  🔐 schedule_hash: {schedule_hash}")
         log(f"  🔐 schedule_tomorrow_hash: {schedule_tomorrow_hash}")
-        log(f"  🔍 Тип schedule_data: {type(schedule_data)}")
         
-        async with db_pool.acquire() as conn:
-            # Перевіряємо які колонки існують
-            columns_check = await conn.fetch("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = 'dtek_checks'
-            """)
-            existing_columns = [row['column_name'] for row in columns_check]
-            has_tomorrow_cols = 'schedule_tomorrow_hash' in existing_columns and 'schedule_tomorrow_data' in existing_columns
-            
-            schedule_json = json.dumps(schedule_data)
-            log(f"  📦 Розмір JSON сьогодні: {len(schedule_json)} символів")
-            
-            # Використовуємо UTC datetime без timezone (naive) для сумісності з PostgreSQL
-            now_utc = datetime.now(UKRAINE_TZ).astimezone(pytz.UTC).replace(tzinfo=None)
-            
-            if has_tomorrow_cols and schedule_tomorrow_data:
-                # Нова структура БД - зберігаємо все
-                schedule_tomorrow_json = json.dumps(schedule_tomorrow_data)
-                log(f"  📦 Розмір JSON завтра: {len(schedule_tomorrow_json)} символів")
+        # Спан всередині try: невдалий запис позначається як error у трасі й метриках
+        with tracer.span('db_write'):
+            async with db_pool.acquire() as conn:
+                has_tomorrow_cols = db_capabilities['tomorrow_columns']
                 
-                await conn.execute(
-                    '''INSERT INTO dtek_checks 
-                       (update_date, schedule_hash, schedule_data, schedule_tomorrow_hash, schedule_tomorrow_data, created_at) 
-                       VALUES ($1, $2, $3, $4, $5, $6)''',
-                    update_date, schedule_hash, schedule_json, schedule_tomorrow_hash, schedule_tomorrow_json, now_utc
-                )
-                log(f"✓ Дані успішно збережено в БД (з графіком завтра)")
-            else:
-                # Стара структура БД - зберігаємо тільки сьогодні
-                await conn.execute(
-                    '''INSERT INTO dtek_checks 
-                       (update_date, schedule_hash, schedule_data, created_at) 
-                       VALUES ($1, $2, $3, $4)''',
-                    update_date, schedule_hash, schedule_json, now_utc
-                )
-                log(f"✓ Дані успішно збережено в БД (без графіка завтра - стара структура)")
+                # Використовуємо UTC datetime без timezone (naive) для сумісності з PostgreSQL
+                now_utc = datetime.now(UKRAINE_TZ).astimezone(pytz.UTC).replace(tzinfo=None)
                 
+                if db_capabilities['compact_columns']:
+                    # Компактний формат: маски півгодин замість JSONB
+                    today = (schedule_data.date, schedule_data.mask, schedule_data.unknown)
+                    tomorrow = (None, None, None)
+                    if schedule_tomorrow_data:
+                        tomorrow = (schedule_tomorrow_data.date, schedule_tomorrow_data.mask, schedule_tomorrow_data.unknown)
+                    else:
+                        schedule_tomorrow_hash = None
+                    
+                    await conn.execute(
+                        '''INSERT INTO dtek_checks 
+                           (update_date, schedule_hash, schedule_date, schedule_mask, schedule_unknown,
+                            schedule_tomorrow_hash, schedule_tomorrow_date, schedule_tomorrow_mask, schedule_tomorrow_unknown,
+                            created_at) 
+                           VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)''',
+                        update_date, schedule_hash, *today, schedule_tomorrow_hash, *tomorrow, now_utc
+                    )
+                    log(f"✓ Дані успішно збережено в БД (компактний формат, маска {today[1]:012x})")
+                elif has_tomorrow_cols and schedule_tomorrow_data:
+                    # Нова структура БД - зберігаємо все (dict кодується JSONB кодеком пулу)
+                    await conn.execute(
+                        '''INSERT INTO dtek_checks 
+                           (update_date, schedule_hash, schedule_data, schedule_tomorrow_hash, schedule_tomorrow_data, created_at) 
+                           VALUES ($1, $2, $3, $4, $5, $6)''',
+                        update_date, schedule_hash, schedule_data.to_dict(), schedule_tomorrow_hash, schedule_tomorrow_data.to_dict(), now_utc
+                    )
+                    log(f"✓ Дані успішно збережено в БД (з графіком завтра)")
+                else:
+                    # Стара структура БД - зберігаємо тільки сьогодні
+                    await conn.execute(
+                        '''INSERT INTO dtek_checks 
+                           (update_date, schedule_hash, schedule_data, created_at) 
+                           VALUES ($1, $2, $3, $4)''',
+                        update_date, schedule_hash, schedule_data.to_dict(), now_utc
+                    )
+                    log(f"✓ Дані успішно збережено в БД (без графіка завтра - стара структура)")
+
     except Exception as e:
         log(f"✖️ Помилка при збереженні в БД: {e}")
         import traceback
         log(f"Stack trace: {traceback.format_exc()}")
 
+CHECK_FOOTERS = {
+    'auto': "Автоматична перевірка",
+    'manual': "Ручна перевірка • !check",
+    'ui': "Перевірка з веб-інтерфейсу",
+}
+
+async def render_outcome_images(outcome, today=True, tomorrow=True):
+    """Зображення графіків результату перевірки; вже готові не перемальовуються.
+    
+    Помилка малювання не зупиняє відправку: зображення лишається None і графік
+    відправляється без нього.
+    """
+    result = outcome['result']
+    schedule_tomorrow = outcome['schedule_tomorrow']
+    jobs = []
+    if today and outcome['image_today'] is None and outcome['schedule_today']:
+        jobs.append(('image_today', result['screenshot_main'], outcome['schedule_today'], outcome['old_schedule']))
+    if tomorrow and outcome['image_tomorrow'] is None and schedule_tomorrow and checker._has_any_outages(schedule_tomorrow):
+        jobs.append(('image_tomorrow', result['screenshot_tomorrow'], schedule_tomorrow, outcome['old_schedule_tomorrow']))
+    
+    for key, screenshot, schedule, old in jobs:
+        try:
+            outcome[key] = await schedule_image(screenshot, schedule, old)
+        except Exception as e:
+            metrics.inc('dtek_failures_total', stage='render')
+            log(f"❌ Не вдалось підготувати зображення графіка ({key}): {e}")
+
+def image_file(image, name, timestamp_str):
+    """discord.File для зображення графіка або None, якщо зображення немає"""
+    if not image:
+        return None
+    return discord.File(io.BytesIO(image), filename=f"{name}_{timestamp_str}.{image_extension(image)}")
+
+async def announce_outcome(outcome):
+    """Відправляє в канал графіки, що змінились"""
+    channel = bot.get_channel(CHANNEL_ID)
+    if not channel:
+        log(f"✖️ Канал {CHANNEL_ID} не знайдено!")
+        return
+    
+    outcome['announced'] = True
+    result = outcome['result']
+    footer = CHECK_FOOTERS.get(outcome['trigger'], CHECK_FOOTERS['auto'])
+    
+    # Для Discord embeds використовуємо naive UTC datetime
+    timestamp_now = datetime.now(UKRAINE_TZ).astimezone(pytz.UTC).replace(tzinfo=None)
+    timestamp_str = datetime.now(UKRAINE_TZ).strftime('%Y%m%d_%H%M%S')
+    
+    # Відправляємо СЬОГОДНІ якщо змінився
+    if outcome['today_changed']:
+        log("📤 Відправляю графік СЬОГОДНІ...")
+        changes_text = outcome['changes_text']
+        
+        # Формуємо дату для заголовка
+        update_date_display = result['update_date'] if result.get('update_date') else 'сьогодні'
+        
+        embed = discord.Embed(
+            title=f"📊 Графік оновився {update_date_display}",
+            color=discord.Color.gold(),
+            timestamp=timestamp_now
+        )
+        
+        if result['update_date']:
+            embed.add_field(
+                name="📅 Дата оновлення на сайті",
+                value=f"`{result['update_date']}`",
+                inline=False
+            )
+        
+        if changes_text:
+            embed.add_field(
+                name="📊 Що змінилось:",
+                value=changes_text,
+                inline=False
+            )
+        
+        embed.set_footer(text=footer)
+        
+        file_main = image_file(outcome['image_today'], 'dtek_today', timestamp_str)
+        if file_main is None:
+            log("⚠️ Відправляю графік СЬОГОДНІ без зображення")
+        
+        with tracer.span('discord_send'):
+            await channel.send(embed=embed, file=file_main)
+        log("✓ Графік СЬОГОДНІ відправлено")
+    else:
+        log("⏸️ Графік СЬОГОДНІ не змінився - пропускаю")
+    
+    # Відправляємо ЗАВТРА якщо змінився і є відключення
+    if outcome['tomorrow_changed'] and outcome['schedule_tomorrow']:
+        if checker._has_any_outages(outcome['schedule_tomorrow']):
+            log("📤 Відправляю графік ЗАВТРА...")
+            changes_text_tomorrow = outcome['changes_text_tomorrow']
+            
+            # Формуємо дату для заголовка
+            tomorrow_date_display = result['second_date'] if result.get('second_date') else 'завтра'
+            
+            embed_tomorrow = discord.Embed(
+                title=f"📅 Графік оновився {tomorrow_date_display}",
+                color=discord.Color.blue(),
+                timestamp=timestamp_now
+            )
+            
+            if changes_text_tomorrow:
+                embed_tomorrow.add_field(
+                    name="📊 Що змінилось:",
+                    value=changes_text_tomorrow,
+                    inline=False
+                )
+            
+            embed_tomorrow.set_footer(text=footer)
+            
+            file_tomorrow = image_file(outcome['image_tomorrow'], 'dtek_tomorrow', timestamp_str)
+            if file_tomorrow is None:
+                log("⚠️ Відправляю графік ЗАВТРА без зображення")
+            
+            with tracer.span('discord_send'):
+                await channel.send(embed=embed_tomorrow, file=file_tomorrow)
+            log("✓ Графік ЗАВТРА відправлено")
+        else:
+            log("⏸️ Завтра немає відключень - не відправляю")
+    elif not outcome['tomorrow_changed']:
+        log("⏸️ Графік ЗАВТРА не змінився - пропускаю")
+
+@tracer.traced('check_pipeline')
+async def run_check_pipeline(trigger):
+    """Єдиний конвеєр перевірки: скріншоти, порівняння з версіями на ті самі дати, збереження, зображення"""
+    priority = PRIORITY_AUTO if trigger == 'auto' else PRIORITY_MANUAL
+    async with page_scheduler.acquire(priority, f'{trigger}_screenshots'):
+        try:
+            result = await asyncio.wait_for(checker.make_screenshots(), timeout=240)
+            log("✅ Скріншоти успішно створено")
+        except asyncio.TimeoutError:
+            log("❌ Таймаут створення скріншотів (4 хвилини)")
+            raise
+    
+    schedule_today = result.get('schedule_today')
+    schedule_tomorrow = result.get('schedule_tomorrow')
+    outcome = {
+        'trigger': trigger,
+        'result': result,
+        'schedule_today': schedule_today,
+        'schedule_tomorrow': schedule_tomorrow,
+        'old_schedule': None,
+        'old_schedule_tomorrow': None,
+        'today_changed': False,
+        'tomorrow_changed': False,
+        'changes_text': None,
+        'changes_text_tomorrow': None,
+        'image_today': None,
+        'image_tomorrow': None,
+        'announced': False,
+        'finished_at': None
+    }
+    
+    log(f"🔍 Отримано графік на сьогодні: {schedule_today!r}")
+    if schedule_tomorrow:
+        log(f"🔍 Отримано графік на завтра: {schedule_tomorrow!r}")
+    
+    if not schedule_today:
+        log("❌ Не вдалось отримати графік на сьогодні")
+        outcome['finished_at'] = time.monotonic()
+        return outcome
+    
+    current_hash = checker._calculate_schedule_hash(schedule_today)
+    current_tomorrow_hash = checker._calculate_schedule_hash(schedule_tomorrow) if schedule_tomorrow else None
+    
+    log(f"🔐 Хеш поточного графіка (сьогодні): {current_hash}")
+    if current_tomorrow_hash:
+        log(f"🔐 Хеш поточного графіка (завтра): {current_tomorrow_hash}")
+    
+    # Порівнюємо з останньою версією графіка на ту саму дату: після півночі
+    # вчорашній графік "на завтра" стає базою для сьогоднішнього
+    today_day = schedule_day(schedule_today, 0)
+    old_schedule = await schedule_store.latest(today_day)
+    today_changed = not schedule_today.same_as(old_schedule)
+    
+    if old_schedule is None:
+        log(f"📊 Графіка на {today_day:%d.%m.%Y} ще не було - вважаємо що змінився")
+    elif today_changed:
+        log(f"🔔 Графік СЬОГОДНІ ({today_day:%d.%m.%Y}) змінився! Попередній хеш: {old_schedule.hash}")
+    else:
+        log(f"⏸️ Графік СЬОГОДНІ ({today_day:%d.%m.%Y}) не змінився")
+    
+    tomorrow_day = None
+    old_schedule_tomorrow = None
+    tomorrow_changed = False
+    if schedule_tomorrow:
+        tomorrow_day = schedule_day(schedule_tomorrow, 1)
+        old_schedule_tomorrow = await schedule_store.latest(tomorrow_day)
+        tomorrow_changed = not schedule_tomorrow.same_as(old_schedule_tomorrow)
+        
+        if old_schedule_tomorrow is None:
+            log(f"ℹ️ Графіка на {tomorrow_day:%d.%m.%Y} ще не було - вважаємо що змінився")
+        elif tomorrow_changed:
+            log(f"🔔 Графік ЗАВТРА ({tomorrow_day:%d.%m.%Y}) змінився! Попередній хеш: {old_schedule_tomorrow.hash}")
+        else:
+            log(f"⏸️ Графік ЗАВТРА ({tomorrow_day:%d.%m.%Y}) не змінився")
+    else:
+        log("ℹ️ Графік ЗАВТРА відсутній")
+    
+    outcome.update({
+        'old_schedule': old_schedule,
+        'old_schedule_tomorrow': old_schedule_tomorrow,
+        'today_changed': today_changed,
+        'tomorrow_changed': tomorrow_changed
+    })
+    
+    # Зберігаємо в БД нові дані: версії по датах і запис перевірки
+    if today_changed:
+        await schedule_store.record(today_day, schedule_today, result['update_date'])
+    if tomorrow_changed:
+        await schedule_store.record(tomorrow_day, schedule_tomorrow, result['update_date'])
+    if today_changed or tomorrow_changed:
+        await save_check(result['update_date'], current_hash, schedule_today, current_tomorrow_hash, schedule_tomorrow)
+    
+    # Порівняння готуємо один раз для всіх, хто чекає на цю перевірку
+    for key, old, new in (
+        ('changes_text', old_schedule, schedule_today),
+        ('changes_text_tomorrow', old_schedule_tomorrow, schedule_tomorrow)
+    ):
+        if old and new:
+            try:
+                outcome[key] = checker._compare_schedules(old, new)
+            except Exception as e:
+                log(f"❌ Помилка при порівнянні: {e}")
+                import traceback
+                log(f"Stack trace: {traceback.format_exc()}")
+    
+    # Збережену зміну одразу відправляємо в канал, хоч би яка перевірка її знайшла:
+    # наступна автоматична перевірка вже побачить її як "без змін"
+    if today_changed or tomorrow_changed:
+        try:
+            await render_outcome_images(outcome, today=today_changed, tomorrow=tomorrow_changed)
+            await announce_outcome(outcome)
+        except Exception as e:
+            metrics.inc('dtek_failures_total', stage='announce')
+            log(f"✖️ Не вдалось відправити зміни в канал: {e}")
+    
+    outcome['finished_at'] = time.monotonic()
+    return outcome
+
+class CheckCoordinator:
+    """Single-flight для конвеєра перевірки: паралельні запити чекають одну перевірку,
+    свіжий результат (молодший за TTL) віддається без нового циклу браузера
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.in_flight = None
+        self.last_outcome = None
+        self.counts = Counter()
+    
+    def fresh_outcome(self, max_age):
+        outcome = self.last_outcome
+        if outcome and max_age > 0 and time.monotonic() - outcome['finished_at'] <= max_age:
+            return outcome
+        return None
+    
+    async def run(self, trigger, max_age=0):
+        """Результат перевірки: з кешу, від перевірки що вже йде, або новий запуск"""
+        cached = self.fresh_outcome(max_age)
+        if cached:
+            self.counts['cached'] += 1
+            age = time.monotonic() - cached['finished_at']
+            log(f"♻️ [{trigger.upper()}] Використовую результат перевірки {age:.0f} с тому ({cached['trigger']})")
+            return cached
+        
+        if self.in_flight is None:
+            self.counts['started'] += 1
+            self.in_flight = asyncio.create_task(run_check_pipeline(trigger))
+            self.in_flight.add_done_callback(self._finished)
+        else:
+            self.counts['attached'] += 1
+            log(f"🔗 [{trigger.upper()}] Перевірка вже йде - чекаю її результат")
+        
+        # shield: скасування одного з тих, хто чекає, не зупиняє спільну перевірку
+        return await asyncio.shield(self.in_flight)
+    
+    def _finished(self, task):
+        self.in_flight = None
+        if not task.cancelled() and task.exception() is None:
+            self.last_outcome = task.result()
+    
+    def stats(self):
+        return {
+            'in_flight': self.in_flight is not None,
+            'last_age': round(time.monotonic() - self.last_outcome['finished_at'], 1) if self.last_outcome else None,
+            'ttl': self.ttl,
+            'counts': dict(self.counts)
+        }
+
+check_coordinator = CheckCoordinator(CHECK_RESULT_TTL)
+
 @bot.event
 async def on_ready():
+    global loop_lag_task
+    
     log(f'✓ {bot.user} підключено до Discord!')
     log(f'✓ Моніторинг каналу: {CHANNEL_ID}')
     log(f'✓ Інтервал перевірки: кожні 5 хвилин')
@@ -2055,6 +4978,13 @@ async def on_ready():
     await init_db_pool()
     await start_web_server()
     
+    # Прогріваємо версії графіків на сьогодні і завтра, далі порівняння йдуть без БД
+    if db_pool and db_capabilities['schema_version'] >= 5:
+        await schedule_store.warm()
+    
+    if loop_lag_task is None:
+        loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+    
     log("")
     log("="*60)
     log("💡 ВАЖЛИВО: Браузер ще не ініціалізовано!")
@@ -2075,6 +5005,7 @@ async def on_ready():
     log("")
 
 @tasks.loop(minutes=5)
+@tracer.traced_cycle('auto')
 async def check_schedule():
     """Періодична перевірка кожні 5 хвилин"""
     channel = None
@@ -2099,7 +5030,20 @@ async def check_schedule():
         
         log("🔍 Починаю перевірку оновлень...")
         
-        has_update = await checker.check_for_update()
+        # Дату оновлення перевіряємо під планувальником сторінки; сам конвеєр
+        # бере сторінку окремо, тож тут її треба відпустити до очікування
+        async with page_scheduler.acquire(PRIORITY_AUTO, 'auto_check'):
+            has_update = None
+            if HTTP_POLLING:
+                has_update = await checker.http_check_for_update()
+                if has_update is None:
+                    log("↩️ HTTP перевірка не вдалась - перевіряю через браузер")
+                elif has_update:
+                    # Синхронізуємо дату оновлення на сторінці браузера
+                    await checker.check_for_update()
+            
+            if has_update is None:
+                has_update = await checker.check_for_update()
         
         if not has_update:
             log(f"ℹ️ Без змін (дата не оновилась)")
@@ -2109,78 +5053,16 @@ async def check_schedule():
             log("")
             return
         
-        # Дата оновилась - робимо скріншоти і парсимо
+        # Дата оновилась - робимо скріншоти і парсимо (або приєднуємось до ручної перевірки, що вже йде)
+        metrics.inc('dtek_updates_detected_total')
         log("📸 Дата оновилась! Роблю скріншоти...")
-        try:
-            result = await asyncio.wait_for(checker.make_screenshots(), timeout=240)
-            log("✅ Скріншоти успішно створено")
-        except asyncio.TimeoutError:
-            log("❌ Таймаут створення скріншотів (4 хвилини)")
-            raise
-        
-        # Отримуємо останню перевірку з БД
-        schedule_today = result.get('schedule_today')
-        schedule_tomorrow = result.get('schedule_tomorrow')
+        # Зміни конвеєр відправляє в канал сам, одразу після збереження
+        outcome = await check_coordinator.run('auto')
         
-        log(f"🔍 Отримано графік на сьогодні: {type(schedule_today)}")
-        if schedule_tomorrow:
-            log(f"🔍 Отримано графік на завтра: {type(schedule_tomorrow)}")
-        
-        if not schedule_today:
-            log("❌ Не вдалось отримати графік на сьогодні")
+        if not outcome['schedule_today']:
             return
         
-        current_hash = checker._calculate_schedule_hash(schedule_today)
-        current_tomorrow_hash = checker._calculate_schedule_hash(schedule_tomorrow) if schedule_tomorrow else None
-        
-        log(f"🔐 Хеш поточного графіка (сьогодні): {current_hash}")
-        if current_tomorrow_hash:
-            log(f"🔐 Хеш поточного графіка (завтра): {current_tomorrow_hash}")
-        
-        last_check = await get_last_check()
-        
-        # Визначаємо які графіки змінились
-        today_changed = True
-        tomorrow_changed = True
-        
-        if last_check:
-            log(f"📂 Знайдено попередню перевірку з БД")
-            log(f"🔐 Хеш попереднього графіка (сьогодні): {last_check['schedule_hash']}")
-            if last_check.get('schedule_tomorrow_hash'):
-                log(f"🔐 Хеш попереднього графіка (завтра): {last_check.get('schedule_tomorrow_hash')}")
-            
-            # Перевіряємо чи змінився графік СЬОГОДНІ
-            if last_check['schedule_hash'] == current_hash:
-                log("⏸️ Графік СЬОГОДНІ не змінився")
-                today_changed = False
-            else:
-                log("🔔 Графік СЬОГОДНІ змінився!")
-                today_changed = True
-            
-            # Перевіряємо чи змінився графік ЗАВТРА
-            if current_tomorrow_hash:
-                if last_check.get('schedule_tomorrow_hash'):
-                    if last_check['schedule_tomorrow_hash'] == current_tomorrow_hash:
-                        log("⏸️ Графік ЗАВТРА не змінився")
-                        tomorrow_changed = False
-                    else:
-                        log("🔔 Графік ЗАВТРА змінився!")
-                        tomorrow_changed = True
-                else:
-                    # Попереднього графіка завтра немає - вважаємо що змінився
-                    log("ℹ️ Попереднього графіка ЗАВТРА немає в БД - вважаємо що змінився")
-                    tomorrow_changed = True
-            else:
-                log("ℹ️ Графік ЗАВТРА відсутній")
-                tomorrow_changed = False
-        else:
-            log("📊 Попередня перевірка не знайдена (перший запуск)")
-            # При першому запуску відправляємо обидва
-            today_changed = True
-            tomorrow_changed = True if current_tomorrow_hash else False
-        
-        # Якщо жоден графік не змінився - не відправляємо нічого
-        if not today_changed and not tomorrow_changed:
+        if not outcome['today_changed'] and not outcome['tomorrow_changed']:
             log("⏸️ Жоден з графіків не змінився - не відправляю повідомлення")
             next_check = datetime.now(UKRAINE_TZ) + timedelta(minutes=5)
             log(f"⏰ Наступна перевірка о: {next_check.strftime('%H:%M:%S')}")
@@ -2188,130 +5070,6 @@ async def check_schedule():
             log("")
             return
         
-        # Зберігаємо в БД нові дані
-        await save_check(result['update_date'], current_hash, schedule_today, current_tomorrow_hash, schedule_tomorrow)
-        
-        # Для Discord embeds використовуємо naive UTC datetime
-        timestamp_now = datetime.now(UKRAINE_TZ).astimezone(pytz.UTC).replace(tzinfo=None)
-        timestamp_str = datetime.now(UKRAINE_TZ).strftime('%Y%m%d_%H%M%S')
-        
-        # Відправляємо СЬОГОДНІ якщо змінився
-        if today_changed:
-            log("📤 Відправляю графік СЬОГОДНІ...")
-            
-            # Порівнюємо з попереднім
-            changes_text = None
-            if last_check and last_check.get('schedule_data'):
-                log("🔄 Починаю порівняння графіків (СЬОГОДНІ)...")
-                old_schedule = last_check['schedule_data']
-                if isinstance(old_schedule, str):
-                    log("⚠️ schedule_data є рядком, конвертую...")
-                    try:
-                        old_schedule = json.loads(old_schedule)
-                    except Exception as e:
-                        log(f"❌ Помилка конвертації: {e}")
-                        old_schedule = None
-                
-                if old_schedule:
-                    try:
-                        changes_text = checker._compare_schedules(old_schedule, schedule_today)
-                        log(f"✓ Порівняння завершено")
-                    except Exception as e:
-                        log(f"❌ Помилка при порівнянні: {e}")
-                        import traceback
-                        log(f"Stack trace: {traceback.format_exc()}")
-                        changes_text = None
-            
-            # Формуємо дату для заголовка
-            update_date_display = result['update_date'] if result.get('update_date') else 'сьогодні'
-            
-            embed = discord.Embed(
-                title=f"📊 Графік оновився {update_date_display}",
-                color=discord.Color.gold(),
-                timestamp=timestamp_now
-            )
-            
-            if result['update_date']:
-                embed.add_field(
-                    name="📅 Дата оновлення на сайті",
-                    value=f"`{result['update_date']}`",
-                    inline=False
-                )
-            
-            if changes_text:
-                embed.add_field(
-                    name="📊 Що змінилось:",
-                    value=changes_text,
-                    inline=False
-                )
-            
-            embed.set_footer(text="Автоматична перевірка")
-            
-            file_main = discord.File(
-                io.BytesIO(result['screenshot_main']), 
-                filename=f"dtek_today_{timestamp_str}.png"
-            )
-            
-            await channel.send(embed=embed, file=file_main)
-            log("✓ Графік СЬОГОДНІ відправлено")
-        else:
-            log("⏸️ Графік СЬОГОДНІ не змінився - пропускаю")
-        
-        # Відправляємо ЗАВТРА якщо змінився Є Є відключення
-        if tomorrow_changed and schedule_tomorrow and result.get('screenshot_tomorrow'):
-            has_outages = checker._has_any_outages(schedule_tomorrow)
-            
-            if has_outages:
-                log("📤 Відправляю графік ЗАВТРА...")
-                
-                # Порівнюємо з попереднім
-                changes_text_tomorrow = None
-                if last_check and last_check.get('schedule_tomorrow_data'):
-                    log("🔄 Починаю порівняння графіків (ЗАВТРА)...")
-                    old_schedule_tomorrow = last_check['schedule_tomorrow_data']
-                    if isinstance(old_schedule_tomorrow, str):
-                        try:
-                            old_schedule_tomorrow = json.loads(old_schedule_tomorrow)
-                        except:
-                            old_schedule_tomorrow = None
-                    
-                    if old_schedule_tomorrow:
-                        try:
-                            changes_text_tomorrow = checker._compare_schedules(old_schedule_tomorrow, schedule_tomorrow)
-                        except Exception as e:
-                            log(f"❌ Помилка порівняння (ЗАВТРА): {e}")
-                            changes_text_tomorrow = None
-                
-                # Формуємо дату для заголовка
-                tomorrow_date_display = result['second_date'] if result.get('second_date') else 'завтра'
-                
-                embed_tomorrow = discord.Embed(
-                    title=f"📅 Графік оновився {tomorrow_date_display}",
-                    color=discord.Color.blue(),
-                    timestamp=timestamp_now
-                )
-                
-                if changes_text_tomorrow:
-                    embed_tomorrow.add_field(
-                        name="📊 Що змінилось:",
-                        value=changes_text_tomorrow,
-                        inline=False
-                    )
-                
-                embed_tomorrow.set_footer(text="Автоматична перевірка")
-                
-                file_tomorrow = discord.File(
-                    io.BytesIO(result['screenshot_tomorrow']), 
-                    filename=f"dtek_tomorrow_{timestamp_str}.png"
-                )
-                
-                await channel.send(embed=embed_tomorrow, file=file_tomorrow)
-                log("✓ Графік ЗАВТРА відправлено")
-            else:
-                log("⏸️ Завтра немає відключень - не відправляю")
-        elif not tomorrow_changed:
-            log("⏸️ Графік ЗАВТРА не змінився - пропускаю")
-        
         log(f"✓ Перевірка завершена")
         next_check = datetime.now(UKRAINE_TZ) + timedelta(minutes=5)
         log(f"⏰ Наступна перевірка о: {next_check.strftime('%H:%M:%S')}")
@@ -2319,6 +5077,7 @@ async def check_schedule():
         log("")
         
     except asyncio.TimeoutError:
+        metrics.inc('dtek_failures_total', stage='check_timeout')
         log(f"⏱️ ТАЙМАУТ: Операція зайняла більше 4 хвилин")
         next_check = datetime.now(UKRAINE_TZ) + timedelta(minutes=5)
         log(f"⏰ Наступна перевірка о: {next_check.strftime('%H:%M:%S')}")
@@ -2336,6 +5095,7 @@ async def check_schedule():
             except:
                 pass
     except Exception as e:
+        metrics.inc('dtek_failures_total', stage='check')
         log(f"✖️ Помилка в check_schedule: {e}")
         next_check = datetime.now(UKRAINE_TZ) + timedelta(minutes=5)
         log(f"⏰ Наступна перевірка о: {next_check.strftime('%H:%M:%S')}")
@@ -2361,10 +5121,11 @@ async def before_check_schedule():
     if checker.browser and checker.page:
         log("🔥 Прогрів сторінки перед першою перевіркою...")
         try:
-            await checker.page.reload(wait_until='domcontentloaded', timeout=30000)
-            await asyncio.sleep(3)
-            await checker._close_attention_popup()
-            await checker._close_survey_if_present()
+            async with page_scheduler.acquire(PRIORITY_AUTO, 'warmup'):
+                await checker.page.reload(wait_until='domcontentloaded', timeout=30000)
+                await checker._wait_page_ready('reload')
+                await checker._close_attention_popup()
+                await checker._close_survey_if_present()
             log("✓ Сторінка прогріта")
         except Exception as e:
             log(f"⚠️ Не вдалось прогріти сторінку: {e}")
@@ -2401,7 +5162,8 @@ async def restart_browser_task():
                     except:
                         pass
                 
-                success = await checker.restart_browser()
+                async with page_scheduler.acquire(PRIORITY_AUTO, 'restart_browser'):
+                    success = await checker.restart_browser()
                 
                 if success:
                     log("✅ Браузер перезапущено успішно!")
@@ -2448,6 +5210,7 @@ async def before_restart_browser_task():
     log("✓ Задача перезапуску браузера готова")
 
 @bot.command(name='check')
+@tracer.traced_cycle('manual')
 async def manual_check(ctx):
     """Ручна перевірка по команді !check"""
     if not checker.browser or not checker.page:
@@ -2458,44 +5221,30 @@ async def manual_check(ctx):
     
     try:
         log("🎮 [MANUAL] Ручна перевірка запущена")
-        result = await asyncio.wait_for(checker.make_screenshots(), timeout=240)
-        log("✅ [MANUAL] Скріншоти створено")
-        
-        schedule_today = result.get('schedule_today')
-        schedule_tomorrow = result.get('schedule_tomorrow')
-        
-        log(f"🔍 [MANUAL] Отримано графік: {type(schedule_today)}")
-        current_hash = checker._calculate_schedule_hash(schedule_today)
-        current_tomorrow_hash = checker._calculate_schedule_hash(schedule_tomorrow) if schedule_tomorrow else None
+        # Якщо перевірка вже йде - чекаємо її; свіжий результат беремо з кешу
+        outcome = await asyncio.wait_for(
+            check_coordinator.run('manual', max_age=CHECK_RESULT_TTL),
+            timeout=240
+        )
+        log("✅ [MANUAL] Результат перевірки отримано")
         
-        log(f"🔐 [MANUAL] Хеш поточного графіка: {current_hash}")
+        result = outcome['result']
+        schedule_today = outcome['schedule_today']
+        schedule_tomorrow = outcome['schedule_tomorrow']
+        if not schedule_today:
+            await ctx.send("❌ Не вдалось отримати графік на сьогодні")
+            return
         
-        last_check = await get_last_check()
+        if outcome['announced'] and ctx.channel.id == CHANNEL_ID:
+            # Зміни вже відправлено в цей канал під час перевірки
+            await ctx.send("✅ Графік оновився - відправлено вище")
+            return
         
-        # Порівнюємо СЬОГОДНІ
-        changes_text = None
-        if last_check and last_check.get('schedule_data'):
-            log("🔄 [MANUAL] Починаю порівняння графіків (СЬОГОДНІ)...")
-            old_schedule = last_check['schedule_data']
-            if isinstance(old_schedule, str):
-                log("⚠️ [MANUAL] schedule_data є рядком, конвертую...")
-                try:
-                    old_schedule = json.loads(old_schedule)
-                except Exception as e:
-                    log(f"❌ [MANUAL] Помилка конвертації: {e}")
-                    old_schedule = None
-            
-            if old_schedule:
-                try:
-                    changes_text = checker._compare_schedules(old_schedule, schedule_today)
-                except Exception as e:
-                    log(f"❌ [MANUAL] Помилка порівняння: {e}")
-                    import traceback
-                    log(f"Stack trace: {traceback.format_exc()}")
-        else:
-            log("📊 [MANUAL] Немає попереднього графіка")
+        changes_text = outcome['changes_text']
+        if not outcome['old_schedule']:
+            log("📊 [MANUAL] Немає попереднього графіка на цю дату")
         
-        await save_check(result['update_date'], current_hash, schedule_today, current_tomorrow_hash, schedule_tomorrow)
+        await render_outcome_images(outcome)
         
         # Для Discord embeds використовуємо naive UTC datetime
         timestamp_now = datetime.now(UKRAINE_TZ).astimezone(pytz.UTC).replace(tzinfo=None)
@@ -2526,58 +5275,39 @@ async def manual_check(ctx):
         
         embed.set_footer(text="Ручна перевірка • !check")
         
-        file_main = discord.File(
-            io.BytesIO(result['screenshot_main']), 
-            filename=f"dtek_manual_today_{timestamp_str}.png"
-        )
+        file_main = image_file(outcome['image_today'], 'dtek_manual_today', timestamp_str)
         
-        await ctx.send(embed=embed, file=file_main)
+        with tracer.span('discord_send'):
+            await ctx.send(embed=embed, file=file_main)
         
         # Відправляємо ЗАВТРА якщо є відключення
-        if schedule_tomorrow and result.get('screenshot_tomorrow'):
-            has_outages = checker._has_any_outages(schedule_tomorrow)
-            if has_outages:
-                # Порівнюємо з попереднім
-                changes_text_tomorrow = None
-                if last_check and last_check.get('schedule_tomorrow_data'):
-                    old_schedule_tomorrow = last_check['schedule_tomorrow_data']
-                    if isinstance(old_schedule_tomorrow, str):
-                        try:
-                            old_schedule_tomorrow = json.loads(old_schedule_tomorrow)
-                        except:
-                            old_schedule_tomorrow = None
-                    
-                    if old_schedule_tomorrow:
-                        try:
-                            changes_text_tomorrow = checker._compare_schedules(old_schedule_tomorrow, schedule_tomorrow)
-                        except:
-                            pass
-                
-                tomorrow_date_display = result['second_date'] if result.get('second_date') else 'завтра'
-                
-                embed_tomorrow = discord.Embed(
-                    title=f"📅 Графік оновився {tomorrow_date_display} (Ручна перевірка)",
-                    color=discord.Color.blue(),
-                    timestamp=timestamp_now
-                )
-                
-                if changes_text_tomorrow:
-                    embed_tomorrow.add_field(
-                        name="📊 Що змінилось:",
-                        value=changes_text_tomorrow,
-                        inline=False
-                    )
-                
-                embed_tomorrow.set_footer(text="Ручна перевірка • !check")
-                
-                file_tomorrow = discord.File(
-                    io.BytesIO(result['screenshot_tomorrow']), 
-                    filename=f"dtek_manual_tomorrow_{timestamp_str}.png"
+        if schedule_tomorrow and checker._has_any_outages(schedule_tomorrow):
+            changes_text_tomorrow = outcome['changes_text_tomorrow']
+            
+            tomorrow_date_display = result['second_date'] if result.get('second_date') else 'завтра'
+            
+            embed_tomorrow = discord.Embed(
+                title=f"📅 Графік оновився {tomorrow_date_display} (Ручна перевірка)",
+                color=discord.Color.blue(),
+                timestamp=timestamp_now
+            )
+            
+            if changes_text_tomorrow:
+                embed_tomorrow.add_field(
+                    name="📊 Що змінилось:",
+                    value=changes_text_tomorrow,
+                    inline=False
                 )
-                
+            
+            embed_tomorrow.set_footer(text="Ручна перевірка • !check")
+            
+            file_tomorrow = image_file(outcome['image_tomorrow'], 'dtek_manual_tomorrow', timestamp_str)
+            
+            with tracer.span('discord_send'):
                 await ctx.send(embed=embed_tomorrow, file=file_tomorrow)
         
     except asyncio.TimeoutError:
+        metrics.inc('dtek_failures_total', stage='manual_timeout')
         log("⏱️ [MANUAL] Таймаут 4 хвилини")
         error_embed = discord.Embed(
             title="⏱️ Таймаут",
@@ -2586,6 +5316,7 @@ async def manual_check(ctx):
         )
         await ctx.send(embed=error_embed)
     except Exception as e:
+        metrics.inc('dtek_failures_total', stage='manual')
         error_embed = discord.Embed(
             title="✖️ Помилка",
             description=f"```{str(e)[:500]}```",
@@ -2693,9 +5424,12 @@ async def stop_bot(ctx):
     try:
         await checker._save_cookies()
         await checker.close_browser()
+        await checker.http_fetcher.close()
     except:
         pass
+    await stop_web_server()
     await close_db_pool()
+    image_pipeline.shutdown()
     await bot.close()
 
 @bot.command(name='restart')
@@ -2708,7 +5442,8 @@ async def restart_browser_command(ctx):
     await ctx.send("🔄 Перезапускаю браузер...")
     log("🎮 [MANUAL] Ручний перезапуск браузера")
     
-    success = await checker.restart_browser()
+    async with page_scheduler.acquire(PRIORITY_MANUAL, 'manual_restart'):
+        success = await checker.restart_browser()
     
     if success:
         await ctx.send("✅ Браузер успішно перезапущено!")
@@ -2742,6 +5477,7 @@ if __name__ == '__main__':
         try:
             asyncio.run(checker._save_cookies())
             asyncio.run(checker.close_browser())
+            asyncio.run(checker.http_fetcher.close())
             asyncio.run(close_db_pool())
         except:
             pass